@@ -1,16 +1,95 @@
+import argparse
 import json
 import csv
 import os
+import sqlite3
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-
-from jira import JIRA
+from functools import lru_cache
+from itertools import islice
 
 
 JIRA_URI = os.getenv('JIRA_URI')
 JIRA_USERNAME = os.getenv('JIRA_USERNAME')
 JIRA_PASSWORD = os.getenv('JIRA_PASSWORD')
 
-jira = JIRA(JIRA_URI, auth=(JIRA_USERNAME, JIRA_PASSWORD))
+
+@lru_cache(maxsize=None)
+def get_jira():
+    """log in on first use, parsing the hits does not need jira"""
+    from jira import JIRA
+    return JIRA(JIRA_URI, auth=(JIRA_USERNAME, JIRA_PASSWORD))
+
+
+def iter_json_array(f, chunk_size=1 << 16, max_item_size=64 << 20):
+    """yield the items of a top level json array one by one
+
+    Only the current chunk and the item being decoded are kept in memory,
+    an item longer than max_item_size chars raises ValueError, so a
+    malformed record does not pull the rest of the file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def fill_item():
+        if len(buf) - pos > max_item_size:
+            raise ValueError(f'json array item at {buf[pos:pos + 20]!r} is larger '
+                             f'than {max_item_size} chars or malformed')
+        fill()
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_ws()
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('input is not a json array')
+    pos += 1
+    skip_ws()
+    if buf[pos:pos + 1] == ']':
+        return
+    while True:
+        skip_ws()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill_item()
+                continue
+            # a number may be cut by the chunk boundary, e.g. '12' of '12.5',
+            # it is complete only when a separator follows
+            if not eof and (end == len(buf) or buf[end] not in ',] \t\r\n'):
+                fill_item()
+                continue
+            break
+        pos = end
+        yield item
+        skip_ws()
+        if buf[pos:pos + 1] == ']':
+            return
+        if buf[pos:pos + 1] != ',':
+            raise ValueError(f'unexpected {buf[pos:pos + 1]!r} in json array')
+        pos += 1
+        skip_ws()
+        if buf[pos:pos + 1] == ']':
+            raise ValueError('trailing comma in json array')
 
 
 def parse_hit(hit):
@@ -24,43 +103,168 @@ def parse_hit(hit):
     return [case_id, reason, url, duration]
 
 
+def issue_owners(issue):
+    assignee, reporter = issue.fields.assignee, issue.fields.reporter
+    return (assignee.displayName if assignee else 'Unknown',
+            reporter.displayName if reporter else 'Unknown')
+
+
 def get_owner(case_id):
-    issue = jira.issue(case_id)
-    return issue.fields.assignee.displayName, issue.fields.reporter.displayName
+    issue = get_jira().issue(case_id)
+    return issue_owners(issue)
+
+
+def get_owners_batch(case_ids):
+    """fetch owners of many issues with one `key in (...)` jql query, fall
+    back to one request per issue if the query fails, e.g. a key has gone"""
+    try:
+        issues = get_jira().search_issues(
+            f'key in ({", ".join(case_ids)})',
+            maxResults=len(case_ids), fields='assignee,reporter')
+    except Exception:  # noqa
+        result = {}
+        for case_id in case_ids:
+            try:
+                result[case_id] = get_owner(case_id)
+            except Exception:  # noqa
+                pass  # reported by lookup_owners
+        return result
+    return {issue.key: issue_owners(issue) for issue in issues}
+
+
+class OwnerCache:
+    """case id -> (owner, qa owner) cached in a sqlite file with TTL"""
 
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self._ttl = ttl
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('create table if not exists owners ('
+                           'case_id text primary key, owner text, qa_owner text, '
+                           'fetched_at real)')
 
-def main():
-    with open('/tmp/hits.json') as f:
+    def get_many(self, case_ids):
+        expire_before = time.time() - self._ttl
+        result = {}
+        case_ids = list(case_ids)
+        # sqlite limits the number of host parameters
+        for i in range(0, len(case_ids), 500):
+            chunk = case_ids[i:i + 500]
+            rows = self._conn.execute(
+                'select case_id, owner, qa_owner from owners '
+                f'where fetched_at > ? and case_id in ({", ".join("?" * len(chunk))})',
+                [expire_before, *chunk])
+            for case_id, owner, qa_owner in rows:
+                result[case_id] = (owner, qa_owner)
+        return result
+
+    def put_many(self, mapping):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                'insert or replace into owners values (?, ?, ?, ?)',
+                [(case_id, owner, qa_owner, now)
+                 for case_id, (owner, qa_owner) in mapping.items()])
+
+    def close(self):
+        self._conn.close()
+
+
+def lookup_owners(case_ids, max_workers=5, cache=None, batch_size=50):
+    """look up owners of the distinct case ids, the cached ones are not
+    fetched and the fetched ones are saved to the cache"""
+    case_ids = sorted(set(case_ids))
+    case_owner_mapping = cache.get_many(case_ids) if cache is not None else {}
+    missing = [case_id for case_id in case_ids if case_id not in case_owner_mapping]
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(get_owners_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            fetched.update(future.result())
+    for case_id in missing:
+        if case_id not in fetched:
+            print('WARN', case_id)
+
+    if cache is not None and fetched:
+        cache.put_many(fetched)
+    case_owner_mapping.update(fetched)
+    return case_owner_mapping
+
+
+def new_csv_writer(csvfile):
+    writer = csv.writer(csvfile, delimiter=',', lineterminator='\r\n',
+                        quoting=csv.QUOTE_ALL)
+    writer.writerow(['case id', 'failed reason', 'url',
+                     'duration', 'owner', 'qa owner'])
+    return writer
+
+
+def write_rows(writer, rows, case_owner_mapping):
+    for row in rows:
+        newrow = row.copy()
+        newrow.extend(case_owner_mapping.get(row[0], ('Unknown', 'Unknown')))
+        writer.writerow(newrow)
+
+
+def main(input_path='/tmp/hits.json', output_path='utf.csv', **lookup_kwargs):
+    with open(input_path) as f:
         hits = json.load(f)
 
     rows = []
     for hit in hits:
         rows.append(parse_hit(hit))
 
-    case_owner_mapping = {}
+    case_owner_mapping = lookup_owners([row[0] for row in rows], **lookup_kwargs)
+
+    with open(output_path, 'w') as csvfile:
+        writer = new_csv_writer(csvfile)
+        write_rows(writer, rows, case_owner_mapping)
 
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_case = {executor.submit(get_owner, row[0]): row[0]
-                          for row in rows}
-        for future in as_completed(future_to_case):
-            case_id = future_to_case[future]
-            try:
-                owner, qa_owner = future.result()
-            except:  # noqa
-                print('WARN', case_id)
-            else:
-                case_owner_mapping[case_id] = (owner, qa_owner)
-
-    with open('utf.csv', 'w') as csvfile:
-        writer = csv.writer(csvfile, delimiter=',', lineterminator='\r\n',
-                            quoting=csv.QUOTE_ALL)
-        writer.writerow(['case id', 'failed reason', 'url',
-                         'duration', 'owner', 'qa owner'])
-        for row in rows:
-            newrow = row.copy()
-            newrow.extend(case_owner_mapping.get(row[0], ('Unknown', 'Unknown')))
-            writer.writerow(newrow)
+
+def main_stream(input_path='/tmp/hits.json', output_path='utf.csv', batch_size=500,
+                **lookup_kwargs):
+    """parse hits lazily and write the csv batch by batch, the memory
+    usage is bounded by batch_size instead of the number of hits"""
+    with open(input_path) as f, open(output_path, 'w') as csvfile:
+        writer = new_csv_writer(csvfile)
+        rows_iter = (parse_hit(hit) for hit in iter_json_array(f))
+        while True:
+            rows = list(islice(rows_iter, batch_size))
+            if not rows:
+                break
+            case_owner_mapping = lookup_owners([row[0] for row in rows], **lookup_kwargs)
+            write_rows(writer, rows, case_owner_mapping)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='convert utf failed hits to csv')
+    parser.add_argument('--input', default='/tmp/hits.json')
+    parser.add_argument('--output', default='utf.csv')
+    parser.add_argument('--stream', action='store_true',
+                        help='parse hits incrementally and write the csv as it goes')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='hits per owner lookup batch in stream mode')
+    parser.add_argument('--workers', type=int, default=5,
+                        help='concurrent jira requests')
+    parser.add_argument('--jql-batch-size', type=int, default=50,
+                        help='issues fetched per `key in (...)` query')
+    parser.add_argument('--cache', default=os.path.expanduser('~/.cache/utf_owners.sqlite'),
+                        help='owner cache file, empty to disable the cache')
+    parser.add_argument('--cache-ttl-hours', type=float, default=24 * 7)
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+        cache = OwnerCache(args.cache, ttl=args.cache_ttl_hours * 3600)
+    lookup_kwargs = dict(max_workers=args.workers, cache=cache,
+                         batch_size=args.jql_batch_size)
+    try:
+        if args.stream:
+            main_stream(args.input, args.output, args.batch_size, **lookup_kwargs)
+        else:
+            main(args.input, args.output, **lookup_kwargs)
+    finally:
+        if cache is not None:
+            cache.close()
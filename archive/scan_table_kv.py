@@ -1,49 +1,222 @@
+import argparse
 import asyncio
+import json
+import os
+import time
+from urllib.parse import quote
 
+import aiohttp
 from tikv_client.asynchronous import RawClient
 from tilo.codec.bytes_ import encode_bytes
 from tilo.codec.number import encode_int
+from tilo.codec.tikv import decode_writes_np, WriteHistogram
 
 
-async def scan_mvcc_delete_records(table_id):
-    client = await RawClient.connect('127.0.0.1:2379')
+SCAN_LIMIT = 5000
+REGION_PAGE_LIMIT = 1024
+
+
+async def list_region_ranges(http, pd, start_key, end_key):
+    """list the [start, end) ranges of regions which overlap with the range
+
+    The region boundaries are clipped to [start_key, end_key).
+    """
+    pd_api = f'{pd}/pd/api/v1'
+    ranges = []
+    key = start_key
+    while True:
+        url = (f'{pd_api}/regions/key?key={quote(bytes(key))}'
+               f'&end_key={quote(bytes(end_key))}&limit={REGION_PAGE_LIMIT}')
+        async with http.get(url) as resp:
+            js = await resp.json()
+        regions = js.get('regions') or []
+        for region in regions:
+            region_start = bytes.fromhex(region['start_key'])
+            region_end = bytes.fromhex(region['end_key'])
+            shard_start = max(region_start, key)
+            # an empty end key means the region is the last one
+            shard_end = end_key if not region_end else min(region_end, end_key)
+            if shard_start < shard_end:
+                ranges.append((shard_start, shard_end))
+        if len(regions) < REGION_PAGE_LIMIT:
+            break
+        key = bytes.fromhex(regions[-1]['end_key'])
+        if not key or key >= end_key:
+            break
+    return ranges or [(start_key, end_key)]
+
+
+class ScanProgress:
+    def __init__(self, shards):
+        self.shards = shards
+        self.done_shards = 0
+        self.keys = 0
+        self.start_time = time.monotonic()
+
+    def keys_per_second(self):
+        elapsed = time.monotonic() - self.start_time
+        return self.keys / elapsed if elapsed > 0 else 0
+
+    def report(self):
+        print(f'{self.done_shards}/{self.shards} shards, {self.keys} kvs, '
+              f'{self.keys_per_second():.0f} keys/s')
+
+
+class ScanCheckpoint:
+    """records the next key to scan of every shard in a local json file
+
+    A shard whose next key is None has been scanned completely. The
+    histogram is saved together with the keys, so a resumed scan reports
+    the same result as an uninterrupted one.
+    """
+
+    def __init__(self, path, table_id, interval=10):
+        self.path = path
+        self.table_id = table_id
+        self.interval = interval
+        self.shards = []  # [[start, end, next], ]
+        self._saved_at = 0
+
+    def init(self, shards):
+        self.shards = [[start, end, start] for start, end in shards]
+
+    def load(self):
+        """load the checkpoint, it returns the saved histogram state
+        or None if there is no checkpoint of the table"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            js = json.load(f)
+        if js['table_id'] != self.table_id:
+            raise ValueError(f'checkpoint {self.path} is for table {js["table_id"]}')
+        self.shards = [[bytes.fromhex(start), bytes.fromhex(end),
+                        None if next_ is None else bytes.fromhex(next_)]
+                       for start, end, next_ in js['shards']]
+        return js['hist']
+
+    def pending(self):
+        """list (index, next, end) of shards which are not finished"""
+        return [(i, next_, end) for i, (_, end, next_) in enumerate(self.shards)
+                if next_ is not None]
+
+    def update(self, index, next_key):
+        self.shards[index][2] = next_key
+
+    def save(self, hist, force=False):
+        now = time.monotonic()
+        if not force and now - self._saved_at < self.interval:
+            return
+        js = {
+            'table_id': self.table_id,
+            'shards': [[start.hex(), end.hex(), None if next_ is None else next_.hex()]
+                       for start, end, next_ in self.shards],
+            'hist': hist.to_dict(),
+        }
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(js, f)
+        # rename is atomic, a crash never leaves a half written checkpoint
+        os.replace(tmp_path, self.path)
+        self._saved_at = now
+
+
+async def scan_shard(client, start_key, end_key, on_kvs):
+    """scan one range in pages, the next page is fetched while the
+    current one is being analysed
+
+    on_kvs is called with each page and the key to continue from,
+    which is None after the last page.
+    """
+    def next_page(key):
+        return asyncio.ensure_future(
+            client.scan(key, end=end_key, limit=SCAN_LIMIT, cf='write'))
+
+    fetching = next_page(start_key)
+    while True:
+        kvs = await fetching
+        if len(kvs) < SCAN_LIMIT:
+            on_kvs(kvs, None)
+            break
+        # the scan results are in key order, the last key is the max one
+        last_key = next(reversed(kvs))
+        # start is inclusive, continue right after the last key
+        next_key = last_key + b'\x00'
+        fetching = next_page(next_key)
+        on_kvs(kvs, next_key)
+
+
+async def scan_mvcc_delete_records(table_id, pd='http://127.0.0.1:2379', concurrency=8,
+                                   checkpoint_path=None, resume=False):
+    pd_addr = pd.split('://', 1)[-1]
+    client = await RawClient.connect(pd_addr)
 
     key_t = encode_int(b't', int(table_id))
     start_key = encode_int(key_t + b'_i', 0)
-    start_key = encode_bytes(b'', start_key)
+    start_key = bytes(encode_bytes(b'', start_key))
     # _s > _r > _i
-    end_key = encode_bytes(b'', key_t + b'_s')
+    end_key = bytes(encode_bytes(b'', key_t + b'_s'))
 
-    delete_count = 0
+    checkpoint = ScanCheckpoint(checkpoint_path or f'scan_table_{table_id}.ckpt.json',
+                                table_id)
+    hist_state = checkpoint.load() if resume else None
+    if hist_state is not None:
+        hist = WriteHistogram.from_dict(hist_state)
+        print(f'resume from checkpoint {checkpoint.path}')
+    else:
+        async with aiohttp.ClientSession() as http:
+            shards = await list_region_ranges(http, pd, start_key, end_key)
+        checkpoint.init(shards)
+        hist = WriteHistogram()
 
-    def analysis(kvs):
-        nonlocal delete_count
-        total = 0
-        for k, v in kvs.items():
-            print(len(v))
-            if v[:1] == b'D':
-                total += 1
-        delete_count += total
-        print(f'analysis {len(kvs)} kvs, {total} deletes')
+    pending = checkpoint.pending()
+    progress = ScanProgress(len(checkpoint.shards))
+    progress.done_shards = len(checkpoint.shards) - len(pending)
 
+    queue = asyncio.Queue()
+    for shard in pending:
+        queue.put_nowait(shard)
 
-    while True:
-        limit = 5000
-        kvs = await client.scan(start_key,
-                                end=end_key,
-                                limit=limit,
-                                cf='write')
-        analysis(kvs)
-        if len(kvs) < limit:
-            break
-        else:
-            start_key = max(kvs)
+    async def worker():
+        while True:
+            try:
+                index, shard_start, shard_end = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            def analysis(kvs, next_key):
+                records = decode_writes_np(list(kvs.values()))
+                hist.add(records)
+                progress.keys += len(kvs)
+                checkpoint.update(index, next_key)
+                checkpoint.save(hist)
+
+            await scan_shard(client, shard_start, shard_end, analysis)
+            progress.done_shards += 1
+            progress.report()
+
+    print(f'scan {len(pending)} shards with {concurrency} workers')
+    try:
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, len(pending)))])
+    finally:
+        checkpoint.save(hist, force=True)
 
-    print('delete count:', delete_count)
+    print(hist.summary())
+    progress.report()
 
 
 if __name__ == '__main__':
-    import sys
+    parser = argparse.ArgumentParser(description='scan mvcc versions of a table')
+    parser.add_argument('table_id', type=int)
+    parser.add_argument('--pd', default='http://127.0.0.1:2379')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='max number of shards scanned concurrently')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file, default to scan_table_{table_id}.ckpt.json')
+    parser.add_argument('--resume', action='store_true',
+                        help='resume the scan from the checkpoint')
+    args = parser.parse_args()
 
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(scan_mvcc_delete_records(int(sys.argv[1])))
+    loop.run_until_complete(scan_mvcc_delete_records(args.table_id, args.pd,
+                                                     args.concurrency,
+                                                     args.checkpoint, args.resume))
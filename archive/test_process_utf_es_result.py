@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from process_utf_es_result import iter_json_array
+
+
+DOCS = [
+    '[]',
+    ' [ ] ',
+    '[12.5]',
+    '[1, -2e-3, 1.5E+10, 0]',
+    '[true, false, null]',
+    '["a,]b", "\\u00e9\\"", ""]',
+    '[{"_source": {"name": "case-1", "d": [1, 2.25]}}, {"a": {}}, [[]]]',
+    '[\n  {"x": 10},\n  {"x": 20}\n]\n',
+]
+
+
+@pytest.mark.parametrize('doc', DOCS)
+def test_iter_json_array_every_chunk_size(doc):
+    expected = json.loads(doc)
+    for chunk_size in range(1, len(doc) + 2):
+        items = list(iter_json_array(io.StringIO(doc), chunk_size=chunk_size))
+        assert items == expected, chunk_size
+
+
+@pytest.mark.parametrize('doc', ['[1,]', '[1 2]', '[1,,2]', '[,1]', '{"a": 1}', '[1', '[12.5x]'])
+def test_iter_json_array_invalid(doc):
+    for chunk_size in range(1, len(doc) + 2):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO(doc), chunk_size=chunk_size))
+
+
+def test_iter_json_array_max_item_size():
+    doc = '[{"a": 1}, {"a": ' + ' ' * 100 + 'x' + '1' * 1000 + ']'
+    f = io.StringIO(doc)
+    items = iter_json_array(f, chunk_size=8, max_item_size=64)
+    assert next(items) == {'a': 1}
+    with pytest.raises(ValueError):
+        next(items)
+    # gave up long before reading the whole document
+    assert f.tell() < 200
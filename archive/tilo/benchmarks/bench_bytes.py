@@ -0,0 +1,45 @@
+"""
+compare encode_bytes/decode_bytes per-key loop with the batch versions
+
+Usage: python benchmarks/bench_bytes.py [count]
+"""
+
+import sys
+import time
+
+from tilo.codec.bytes_ import (
+    encode_bytes, encode_bytes_many,
+    decode_bytes, decode_bytes_many,
+)
+from tilo.codec.number import encode_int
+
+
+def gen_keys(count):
+    key_t = encode_int(b't', 11)
+    return [bytes(encode_int(key_t + b'_r', i)) for i in range(count)]
+
+
+def bench(name, func, keys):
+    start = time.perf_counter()
+    func(keys)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<24} {elapsed:8.3f}s {len(keys) / elapsed:14.0f} keys/s')
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    keys = gen_keys(count)
+    print(f'encode {count} keys')
+    bench('encode_bytes (loop)', lambda ks: [encode_bytes(b'', k) for k in ks], keys)
+    bench('encode_bytes_many', encode_bytes_many, keys)
+
+    # raw write cf keys, encoded user key followed by 8 bytes ts
+    keys = [bytes(encode_bytes(b'', k)) + b'\x00' * 8 for k in keys]
+    print(f'decode {count} keys')
+    bench('decode_bytes (loop)', lambda ks: [decode_bytes(k) for k in ks], keys)
+    bench('decode_bytes_many', decode_bytes_many, keys)
+
+
+if __name__ == '__main__':
+    main()
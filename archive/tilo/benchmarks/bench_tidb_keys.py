@@ -0,0 +1,33 @@
+"""
+compare decode_key per-key loop with decode_keys_np on write cf keys
+
+Usage: python benchmarks/bench_tidb_keys.py [count]
+"""
+
+import sys
+
+from tilo.codec.bytes_ import encode_bytes_many
+from tilo.codec.number import encode_int
+from tilo.codec.tidb import decode_key, decode_keys_np
+
+from bench_bytes import bench
+
+
+def gen_write_keys(count):
+    key_t = encode_int(b't', 11)
+    buf, offsets = encode_bytes_many([encode_int(key_t + b'_r', i) for i in range(count)])
+    ts = (~(1 << 60) & 0xffffffffffffffff).to_bytes(8, 'big')
+    return [bytes(buf[offsets[i]:offsets[i+1]]) + ts for i in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    keys = gen_write_keys(count)
+    print(f'decode {count} write cf keys')
+    loop = bench('decode_key (loop)', lambda ks: [decode_key(k) for k in ks], keys)
+    batch = bench('decode_keys_np', decode_keys_np, keys)
+    print(f'speedup: {loop / batch:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import pytest
+
+from tilo.codec.bytes_ import (
+    encode_bytes, encode_bytes_many,
+    decode_bytes, decode_bytes_many,
+)
+from tilo.codec.excs import DecodeError, InsufficientBytesError
+
+
+@pytest.fixture
+def datas():
+    return [b'', b'a', b'1234567', b'12345678', b'123456789',
+            b'\x00\xff' * 9, bytes(range(40))]
+
+
+def test_encode_bytes_many(datas):
+    buf, offsets = encode_bytes_many(datas)
+    assert len(offsets) == len(datas) + 1
+    assert offsets[-1] == len(buf)
+    for i, data in enumerate(datas):
+        assert bytes(buf[offsets[i]:offsets[i+1]]) == encode_bytes(b'', data)
+
+
+def test_encode_bytes_many_empty():
+    buf, offsets = encode_bytes_many([])
+    assert len(buf) == 0
+    assert offsets == [0]
+
+
+def test_decode_bytes(datas):
+    for data in datas:
+        rest, value = decode_bytes(encode_bytes(b'', data) + b'\x01\x02')
+        assert value == data
+        assert isinstance(rest, memoryview)
+        assert rest == b'\x01\x02'
+
+
+def test_decode_bytes_invalid():
+    with pytest.raises(InsufficientBytesError):
+        decode_bytes(b'abc')
+    with pytest.raises(DecodeError):
+        decode_bytes(b'abc\x00\x00\x00\x00\x00\xf0')
+    with pytest.raises(DecodeError):
+        decode_bytes(b'abc\x00\x00\x01\x00\x00\xfa')
+
+
+def test_decode_bytes_many(datas):
+    # same length keys go through the columnar path
+    keys = [encode_bytes(b'', b'%08d' % i) + b'ts' for i in range(100)]
+    values, rests = decode_bytes_many(keys)
+    assert values == [b'%08d' % i for i in range(100)]
+    assert all(rest == b'ts' for rest in rests)
+
+    # mixed length keys go through the per key path
+    keys = [encode_bytes(b'', data) for data in datas]
+    values, rests = decode_bytes_many(keys)
+    assert values == datas
+    assert all(len(rest) == 0 for rest in rests)
+
+
+def test_decode_bytes_many_same_len_different_layout():
+    keys = [encode_bytes(b'', b'1234567') + b'123456789',
+            encode_bytes(b'', b'12345678')]
+    values, rests = decode_bytes_many(keys)
+    assert values == [b'1234567', b'12345678']
+    assert [bytes(rest) for rest in rests] == [b'123456789', b'']
@@ -0,0 +1,71 @@
+import pytest
+
+from tilo.codec.bytes_ import encode_bytes, encode_bytes_many
+from tilo.codec.excs import CodecError, DecodeError
+from tilo.codec.number import encode_int
+from tilo.codec.tidb import (
+    encode_int_row_key, decode_key, decode_keys_np, ROW_KIND, INDEX_KIND,
+)
+
+
+def encode_index_key(table_id, index_id, value: bytes):
+    key = encode_int(b't', table_id) + b'_i'
+    key = encode_int(key, index_id) + value
+    return encode_bytes(b'', key)
+
+
+def encode_ts(ts):
+    return (~ts & 0xffffffffffffffff).to_bytes(8, 'big')
+
+
+@pytest.fixture
+def keys():
+    return [
+        bytes(encode_int_row_key(11, 10)) + encode_ts(400),
+        bytes(encode_index_key(11, 2, b'\x03hello world')) + encode_ts(500),
+        bytes(encode_int_row_key(-1, -7)) + encode_ts(1 << 62),
+    ]
+
+
+def test_decode_key(keys):
+    assert decode_key(keys[0]) == (11, ROW_KIND, 10, 400)
+    assert decode_key(keys[1]) == (11, INDEX_KIND, 2, 500)
+    assert decode_key(keys[2]) == (-1, ROW_KIND, -7, 1 << 62)
+
+
+def test_decode_keys_np(keys):
+    pytest.importorskip('numpy')
+    decoded = decode_keys_np(keys)
+    assert decoded.table_id.tolist() == [11, 11, -1]
+    assert decoded.kind.tolist() == [ROW_KIND, INDEX_KIND, ROW_KIND]
+    assert decoded.handle.tolist() == [10, 2, -7]
+    assert decoded.ts.tolist() == [400, 500, 1 << 62]
+
+
+def test_decode_keys_np_buffer():
+    pytest.importorskip('numpy')
+    user_keys = [encode_int(encode_int(b't', 5) + b'_r', i) for i in range(10)]
+    buf, offsets = encode_bytes_many(user_keys)
+    decoded = decode_keys_np(bytes(buf), offsets, with_ts=False)
+    assert decoded.handle.tolist() == list(range(10))
+    assert decoded.table_id.tolist() == [5] * 10
+
+
+def test_decode_keys_np_invalid(keys):
+    pytest.importorskip('numpy')
+    bad = bytes(encode_bytes(b'', b'x' * 20)) + encode_ts(1)
+    with pytest.raises(DecodeError):
+        decode_keys_np(keys + [bad])
+
+
+@pytest.mark.parametrize('cut', [1, 2, 3])
+def test_decode_truncated_key(keys, cut):
+    # a 16-18 byte user key still encodes to as many bytes as a full one
+    user_key = (encode_int(b't', 11) + b'_r' + encode_int(b'', 10))[:-cut]
+    bad = bytes(encode_bytes(b'', user_key)) + encode_ts(1)
+    assert len(bad) == len(keys[0])
+    with pytest.raises(CodecError):
+        decode_key(bad)
+    pytest.importorskip('numpy')
+    with pytest.raises(CodecError):
+        decode_keys_np(keys + [bad])
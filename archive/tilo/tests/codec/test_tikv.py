@@ -1,6 +1,10 @@
 import pytest
 
-from tilo.codec.tikv import decode_write_key
+from tilo.codec.excs import DecodeError, InsufficientBytesError
+from tilo.codec.tikv import (
+    decode_write_key, decode_write, decode_writes_np, WriteHistogram,
+    WRITE_TYPE_PUT, WRITE_TYPE_DELETE, WRITE_TYPE_LOCK, WRITE_TYPE_ROLLBACK,
+)
 
 
 @pytest.fixture
@@ -10,7 +14,69 @@ def key1():
             b"\x00\x00\x00\x00\xfa\xfa'\xe3\x94\xb1\xf7\xff\xf9")
 
 
+def encode_var_uint(v):
+    b = bytearray()
+    while v >= 0x80:
+        b.append(v & 0x7f | 0x80)
+        v >>= 7
+    b.append(v)
+    return bytes(b)
+
+
+@pytest.fixture
+def values():
+    return [
+        b'P' + encode_var_uint(421112345678901234) + b'v\x03abc',
+        b'D' + encode_var_uint(421112345678901235),
+        b'L' + encode_var_uint(1),
+        b'R' + encode_var_uint(127) + b'R',
+        b'P' + encode_var_uint(128),
+        b'P' + encode_var_uint((1 << 64) - 1) + b'v\x00',
+    ]
+
+
 def test_decode_write_key(key1):
     user_key, ts = decode_write_key(key1)
-    print(ts >> 18)
-    print(ts - (ts >> 18 << 18))
+    assert user_key == key1[:-8]
+    assert ts == 0x05d81c6b4e080006
+
+
+def test_decode_write(values):
+    assert decode_write(values[0]) == (WRITE_TYPE_PUT, 421112345678901234, b'abc')
+    assert decode_write(values[1]) == (WRITE_TYPE_DELETE, 421112345678901235, None)
+    assert decode_write(values[2]) == (WRITE_TYPE_LOCK, 1, None)
+    assert decode_write(values[3]) == (WRITE_TYPE_ROLLBACK, 127, None)
+    assert decode_write(values[5]).short_value == b''
+    with pytest.raises(DecodeError):
+        decode_write(b'X\x01')
+    with pytest.raises(InsufficientBytesError):
+        decode_write(b'P\x81')
+
+
+def test_decode_writes_np(values):
+    pytest.importorskip('numpy')
+    records = decode_writes_np(values)
+    expected = [decode_write(value) for value in values]
+    assert records.write_type.tolist() == [r.write_type for r in expected]
+    assert records.start_ts.tolist() == [r.start_ts for r in expected]
+    assert records.short_value_len.tolist() == [
+        -1 if r.short_value is None else len(r.short_value) for r in expected]
+
+
+def test_decode_writes_np_truncated():
+    pytest.importorskip('numpy')
+    with pytest.raises(InsufficientBytesError):
+        decode_writes_np([b'P\x01', b'P\x81'])
+
+
+def test_write_histogram(values):
+    pytest.importorskip('numpy')
+    hist = WriteHistogram()
+    hist.add(decode_writes_np(values))
+    hist.add(decode_writes_np(values[:2]))
+    assert hist.total == 8
+    assert hist.counts == {'put': 4, 'delete': 2, 'lock': 1, 'rollback': 1}
+    assert hist.short_value_counts['put'] == 3
+    assert sum(hist.short_value_hist) == 3
+    assert 'total 8 versions' in hist.summary()
+    assert WriteHistogram.from_dict(hist.to_dict()).to_dict() == hist.to_dict()
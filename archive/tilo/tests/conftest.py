@@ -0,0 +1,68 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_to_bytes
+
+import pytest
+
+
+class FakePdHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, js, status=200):
+        body = json.dumps(js).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        if self.path.startswith('/pd/api/v1/region/id/'):
+            region_id = int(self.path.rsplit('/', 1)[1])
+            # PD answers null for a region which does not exist
+            self._reply(self.server.regions.get(region_id))
+        elif self.path.startswith('/pd/api/v1/region/key/'):
+            key = unquote_to_bytes(self.path.rsplit('/', 1)[1])
+            for region in self.server.regions.values():
+                start, end = bytes.fromhex(region['start_key']), bytes.fromhex(region['end_key'])
+                if start <= key and (not end or key < end):
+                    self._reply(region)
+                    break
+            else:
+                self._reply({})
+        elif self.path == '/pd/api/v1/stores':
+            self._reply({'count': 1, 'stores': [{'store': {'id': 1}}]})
+        else:
+            self._reply({}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        js = json.loads(self.rfile.read(length) or b'{}')
+        self.server.requests.append(('POST', self.path, js))
+        self._reply({})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pd_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakePdHandler)
+    server.requests = []
+    server.regions = {
+        2: {'id': 2, 'start_key': '', 'end_key': '7480', 'leader': {'store_id': 1}},
+        4: {'id': 4, 'start_key': '7480', 'end_key': '', 'leader': {'store_id': 1}},
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pd_url(pd_server):
+    host, port = pd_server.server_address
+    return f'http://{host}:{port}'
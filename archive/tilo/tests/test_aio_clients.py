@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from tilo.clients import Op
+
+aio_clients = pytest.importorskip('tilo.aio_clients')
+
+
+def test_async_pd_client_batch(pd_server, pd_url):
+    async def run():
+        async with aio_clients.AsyncPdClient(pd_url, concurrency=2) as pd:
+            oks = await pd.add_operators([Op.transfer_leader(2, 1),
+                                          Op.merge_region(2, 4)])
+            regions = await pd.get_regions([4, 2])
+            ok = await pd.transfer_leader(4, 1)
+            return oks, regions, ok
+
+    oks, regions, ok = asyncio.run(run())
+    assert oks == [True, True]
+    assert [region['id'] for region in regions] == [4, 2]
+    assert ok is True
+    posted = [req[2]['name'] for req in pd_server.requests if req[0] == 'POST']
+    assert sorted(posted) == ['merge-region', 'transfer-leader', 'transfer-leader']
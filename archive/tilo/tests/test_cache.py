@@ -0,0 +1,82 @@
+import threading
+
+from tilo.cache import RegionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def region(region_id, start_key, end_key):
+    return {'id': region_id, 'start_key': start_key, 'end_key': end_key}
+
+
+def test_region_cache_lookup_by_key():
+    cache = RegionCache(ttl=10)
+    cache.put_region(region(2, '', '7480'))
+    cache.put_region(region(4, '7480', '7490'))
+    cache.put_region(region(6, '7490', ''))
+    assert cache.get_region_by_key(b'')['id'] == 2
+    assert cache.get_region_by_key(b'\x74\x80')['id'] == 4
+    assert cache.get_region_by_key(b'\x74\x8f\xff')['id'] == 4
+    assert cache.get_region_by_key(b'\xff')['id'] == 6
+
+    cache.invalidate_region(4)
+    assert cache.get_region_by_key(b'\x74\x80') is None
+    assert cache.get_region(4) is None
+
+
+def test_region_cache_gap_and_merge():
+    cache = RegionCache(ttl=10)
+    cache.put_region(region(2, '', '7480'))
+    cache.put_region(region(6, '7490', ''))
+    # the range [7480, 7490) is not cached
+    assert cache.get_region_by_key(b'\x74\x85') is None
+
+    # region 4 is merged into region 8, which takes the start key
+    cache.put_region(region(4, '7480', '7490'))
+    cache.put_region(region(8, '7480', ''))
+    assert cache.get_region(4) is None
+    assert cache.get_region_by_key(b'\x74\x85')['id'] == 8
+
+
+def test_region_cache_ttl():
+    clock = FakeClock()
+    cache = RegionCache(ttl=5, clock=clock)
+    cache.put_region(region(2, '', ''))
+    cache.put_stores([{'store': {'id': 1}}])
+    clock.now = 4
+    assert cache.get_region(2)['id'] == 2
+    assert cache.get_stores() is not None
+    clock.now = 5
+    assert cache.get_region(2) is None
+    assert cache.get_region_by_key(b'a') is None
+    assert cache.get_stores() is None
+
+
+def test_region_cache_threads():
+    cache = RegionCache(ttl=10)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(500):
+                region_id = n * 1000 + i
+                start = f'{n:02x}{i:04x}'
+                cache.put_region(region(region_id, start, start + '00'))
+                cache.get_region_by_key(bytes.fromhex(start))
+                cache.invalidate_region(region_id)
+        except Exception as e:  # noqa
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert cache.get_region_by_key(b'\x00') is None
@@ -0,0 +1,47 @@
+from tilo.clients import PdClient
+
+
+def test_pd_client_reuses_connection(pd_url):
+    pd = PdClient(pd_url, pool_size=2)
+    for _ in range(5):
+        assert pd.get_region(2)['id'] == 2
+    assert pd.transfer_leader(2, 1) is True
+    assert pd.connection_stats() == {'opened': 1, 'reused': 5}
+    pd.close()
+
+
+def test_pd_client_cache(pd_server, pd_url):
+    pd = PdClient(pd_url, cache_ttl=60)
+    for _ in range(3):
+        assert pd.get_region(2)['id'] == 2
+        assert pd.get_region_by_key(b'\x74\x80\x01')['id'] == 4
+        assert len(pd.list_stores()) == 1
+    assert len(pd_server.requests) == 3
+
+    # the operator invalidates region 2 and the stores
+    pd.transfer_leader(2, 1)
+    pd.get_region(2)
+    pd.get_region(4)
+    pd.list_stores()
+    assert len(pd_server.requests) == 6
+
+
+def test_pd_client_cache_operator_race(pd_server, pd_url):
+    pd = PdClient(pd_url, cache_ttl=60)
+    post = pd._post
+
+    def racing_post(*args, **kwargs):
+        # a concurrent lookup caches region 2 while the operator is in flight
+        pd.get_region(2)
+        return post(*args, **kwargs)
+
+    pd._post = racing_post
+    pd.transfer_leader(2, 1)
+    assert pd.cache.get_region(2) is None
+
+
+def test_pd_client_cache_missing_region(pd_server, pd_url):
+    # e.g. a region merged away, PD returns null
+    for cache_ttl in (None, 60):
+        pd = PdClient(pd_url, cache_ttl=cache_ttl)
+        assert pd.get_region(404) is None
@@ -0,0 +1,56 @@
+import threading
+
+from tilo.loader import load_rows, split_ranges
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, args=None):
+        self.conn.executed.append((sql, args))
+
+
+class FakeConn:
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+def test_load_rows_matches_split_points():
+    conns = []
+    lock = threading.Lock()
+
+    def conn_factory():
+        conn = FakeConn()
+        with lock:
+            conns.append(conn)
+        return conn
+
+    result = load_rows(conn_factory, 't', 0, 10000, 3, rows=3000,
+                       workers=2, batch_size=100)
+    assert result.rows == 3000
+
+    keys = []
+    for conn in conns:
+        for sql, args in conn.executed:
+            assert sql.startswith('insert into t (a) values (%s), ')
+            keys.extend(args)
+    assert len(set(keys)) == 3000
+    for start, end in split_ranges(0, 10000, 3):
+        assert sum(1 for k in keys if start <= k < end) == 1000
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from tilo.runner import ScenarioContext, ScenarioStopped, run_scenarios
+from tilo.wait import WaitTimeout
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_run_scenarios():
+    pd, pg = object(), object()
+    seen = []
+    conns = []
+    lock = threading.Lock()
+
+    def conn_factory():
+        conn = FakeConn()
+        conns.append(conn)
+        return conn
+
+    def scenario(ctx):
+        assert ctx.pd is pd and ctx.pg is pg
+        with lock:
+            seen.append(ctx.table)
+        ctx.conn
+        ctx.checkpoint('merged')
+        if ctx.index == 3:
+            raise ValueError('boom')
+
+    results = run_scenarios(scenario, 5, concurrency=2, pd=pd, pg=pg,
+                            conn_factory=conn_factory, table_prefix='t_')
+    assert sorted(seen) == [f't_{i}' for i in range(5)]
+    assert [r.ok for r in results] == [True, True, True, False, True]
+    assert 'boom' in results[3].error
+    assert all(r.checkpoints[0][0] == 'merged' for r in results)
+    assert len(conns) == 5 and all(conn.closed for conn in conns)
+
+
+def test_checkpoint_hold_returns_on_stop():
+    stop_event = threading.Event()
+    stop_event.set()
+    ctx = ScenarioContext(pd=object(), pg=object(), hold=60, stop_event=stop_event)
+    ctx.checkpoint('never blocks')
+    assert len(ctx.checkpoints) == 1
+
+
+class FakePlayground:
+    def __init__(self):
+        self.partitioned = set()
+        self.lock = threading.Lock()
+
+    def partition(self, pid):
+        with self.lock:
+            # instances never partition concurrently
+            assert not self.partitioned
+            self.partitioned.add(pid)
+        return True
+
+    def unpartition(self, pid):
+        with self.lock:
+            self.partitioned.discard(pid)
+        return True
+
+
+def test_run_scenarios_fault_phase():
+    pg = FakePlayground()
+
+    def scenario(ctx):
+        with ctx.fault_phase():
+            assert ctx.partition(100 + ctx.index % 3) is True
+            ctx.checkpoint('partitioned')
+            if ctx.index == 2:
+                raise ValueError('boom')
+            assert ctx.unpartition(100 + ctx.index % 3) is True
+
+    results = run_scenarios(scenario, 6, concurrency=3, pd=object(), pg=pg,
+                            conn_factory=FakeConn, hold=0.01)
+    assert [r.ok for r in results] == [True, True, False, True, True, True]
+    assert pg.partitioned == set()
+
+
+def test_run_scenarios_heals_partitions():
+    pg = FakePlayground()
+
+    def scenario(ctx):
+        ctx.partition(100)
+        raise ValueError('boom')
+
+    results = run_scenarios(scenario, 1, pd=object(), pg=pg, conn_factory=FakeConn)
+    assert not results[0].ok
+    assert pg.partitioned == set()
+
+
+def test_context_wait_gives_up_on_stop():
+    stop_event = threading.Event()
+    ctx = ScenarioContext(pd=object(), pg=object(), stop_event=stop_event)
+    assert ctx.wait_until(lambda: True, timeout=1).ok
+    stop_event.set()
+    with pytest.raises(ScenarioStopped):
+        ctx.wait_until(lambda: False, timeout=60)
+    with pytest.raises(WaitTimeout):
+        ScenarioContext(pd=object(), pg=object()).wait_until(lambda: False, timeout=0.01)
@@ -0,0 +1,129 @@
+import threading
+
+import pymysql
+import pytest
+
+from tilo.sql_pool import SqlPool, PoolClosed, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self, uri):
+        self.uri = uri
+        self.open = True
+        self.alive = True
+        self.rollbacks = 0
+
+    def rollback(self):
+        if not self.alive:
+            raise pymysql.OperationalError(2006, 'gone away')
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise pymysql.OperationalError(2006, 'gone away')
+
+    def close(self):
+        self.open = False
+
+
+class FakeConnect:
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.conns = []
+        self.lock = threading.Lock()
+
+    def __call__(self, uri):
+        if uri in self.down:
+            raise pymysql.OperationalError(2003, "can't connect")
+        conn = FakeConn(uri)
+        with self.lock:
+            self.conns.append(conn)
+        return conn
+
+
+URIS = 'mysql://root@h1:4000,mysql://root@h2:4000'
+
+
+def test_pool_spreads_and_reuses():
+    connect = FakeConnect()
+    pool = SqlPool(URIS, size=4, connect=connect)
+    conns = [pool.get() for _ in range(4)]
+    assert sorted(c.uri for c in conns) == sorted(URIS.split(',') * 2)
+    with pytest.raises(PoolTimeout):
+        pool.get(timeout=0.01)
+    for conn in conns:
+        conn.close()
+    with pool.connection() as conn:
+        assert conn.open
+    assert pool.stats['opened'] == 4
+    assert pool.stats['reused'] == 1
+
+
+def test_pool_recycles_broken_connections():
+    connect = FakeConnect()
+    pool = SqlPool(URIS, size=1, check_idle_seconds=0, connect=connect)
+    conn = pool.get()
+    conn._conn.alive = False
+    conn.close()
+    # the dead connection fails to roll back on release and is replaced
+    conn = pool.get()
+    assert conn._conn.alive
+    assert pool.stats['recycled'] == 1
+    conn.close()
+
+    with pytest.raises(pymysql.OperationalError):
+        with pool.connection():
+            raise pymysql.OperationalError(2013, 'lost connection')
+    assert pool.stats['recycled'] == 2
+
+
+def test_pool_skips_down_endpoint():
+    connect = FakeConnect(down={'mysql://root@h1:4000'})
+    pool = SqlPool(URIS, size=3, connect=connect)
+    conns = [pool.get() for _ in range(3)]
+    assert {c.uri for c in conns} == {'mysql://root@h2:4000'}
+    assert pool.stats['connect_errors'] == 1
+
+
+def test_pool_rolls_back_on_release():
+    connect = FakeConnect()
+    pool = SqlPool(URIS, size=1, connect=connect)
+    conn = pool.get()
+    conn.close()
+    assert connect.conns[0].rollbacks == 1
+
+    # a connection which fails to roll back is not reused
+    conn = pool.get()
+    conn._conn.alive = False
+    conn.close()
+    assert not connect.conns[0].open
+    assert pool.stats['recycled'] == 1
+    with pool.connection():
+        assert len(connect.conns) == 2
+
+
+def test_pool_pings_idle_connections():
+    connect = FakeConnect()
+    pool = SqlPool(URIS, size=1, check_idle_seconds=0, connect=connect)
+    pool.get().close()
+    # the connection dies while idle in the pool
+    connect.conns[0].alive = False
+    conn = pool.get()
+    assert conn._conn is connect.conns[1]
+    assert not connect.conns[0].open
+    assert pool.stats == {'opened': 2, 'reused': 0, 'recycled': 1, 'connect_errors': 0}
+    conn.close()
+
+
+def test_pool_close_with_borrowed_connection():
+    connect = FakeConnect()
+    pool = SqlPool(URIS, size=2, connect=connect)
+    borrowed = pool.get()
+    pool.get().close()
+    pool.close()
+    assert not connect.conns[1].open
+    assert connect.conns[0].open
+    borrowed.close()
+    assert not connect.conns[0].open
+    with pytest.raises(PoolClosed):
+        pool.get()
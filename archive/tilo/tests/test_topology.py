@@ -0,0 +1,98 @@
+import threading
+
+from tilo.clients import PlaygroundInstance
+from tilo.topology import PlaygroundTopology
+
+
+class FakePg:
+    def __init__(self, instances):
+        self.instances = instances
+        self.calls = 0
+
+    def list_instances(self):
+        self.calls += 1
+        return list(self.instances)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePd:
+    def __init__(self, stores):
+        self.stores = stores
+
+    def list_stores(self):
+        return [{'store': {'id': store_id, 'address': address}}
+                for store_id, address in self.stores]
+
+
+def test_topology_lookup():
+    pg = FakePg([PlaygroundInstance('100', 'pd', '1m', '2379'),
+                 PlaygroundInstance('101', 'tikv', '1m', '20160'),
+                 PlaygroundInstance('102', 'tikv', '1m', '20161')])
+    pd = FakePd([(1, '127.0.0.1:30160'), (4, '127.0.0.1:30161')])
+    clock = FakeClock()
+    topo = PlaygroundTopology(pg, pd, clock=clock)
+
+    assert topo.store_pid(1) == '101'
+    assert topo.store_pid(4) == '102'
+    assert topo.by_pid(100).role == 'pd'
+    assert topo.by_port(20161).store_id == 4
+    assert [node.pid for node in topo.stores()] == ['101', '102']
+    assert pg.calls == 1
+
+    # a new store, the miss triggers one refresh
+    pg.instances.append(PlaygroundInstance('103', 'tikv', '1m', '20162'))
+    pd.stores.append((5, '127.0.0.1:30162'))
+    clock.now = 1
+    assert topo.store_pid(5) == '103'
+    assert pg.calls == 2
+
+    # misses right after a refresh do not refetch
+    assert topo.store_pid(6) is None
+    assert topo.by_pid(999) is None
+    assert pg.calls == 2
+    clock.now = 2
+    assert topo.store_pid(6) is None
+    assert pg.calls == 3
+
+    # a removed instance
+    pg.instances.pop(0)
+    topo.refresh()
+    assert topo.by_pid(100) is None
+    assert len(topo.nodes('tikv')) == 3
+
+
+def test_topology_readers_during_refresh():
+    pg = FakePg([PlaygroundInstance(str(100 + i), 'tikv', '1m', str(20160 + i))
+                 for i in range(3)])
+    pd = FakePd([(i + 1, f'127.0.0.1:{30160 + i}') for i in range(3)])
+    topo = PlaygroundTopology(pg, pd)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                assert [node.store_id for node in topo.stores()] == [1, 2, 3]
+            except Exception as e:  # noqa
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(200):
+        # the pids change, every node is replaced
+        pg.instances = [PlaygroundInstance(str(1000 * i + j), 'tikv', '1m', str(20160 + j))
+                        for j in range(3)]
+        topo.refresh()
+    stop.set()
+    for t in readers:
+        t.join()
+    assert errors == []
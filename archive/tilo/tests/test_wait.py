@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from tilo.clients import wait_till_true
+from tilo.wait import Backoff, WaitTimeout, wait_all, wait_until, async_wait_all
+
+
+class Counter:
+    def __init__(self, true_after):
+        self.calls = 0
+        self.true_after = true_after
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls >= self.true_after
+
+
+def test_wait_until():
+    cond = Counter(3)
+    stats = wait_until(cond, timeout=5, backoff=Backoff(0.001))
+    assert stats.ok is True
+    assert stats.attempts == 3
+
+
+def test_wait_all_drops_finished_conditions():
+    fast, slow = Counter(1), Counter(4)
+    stats = wait_all({'fast': fast, 'slow': slow}, backoff=Backoff(0.001))
+    assert [(s.name, s.attempts) for s in stats] == [('fast', 1), ('slow', 4)]
+    assert fast.calls == 1
+
+
+def test_wait_all_timeout():
+    with pytest.raises(WaitTimeout) as excinfo:
+        wait_all([Counter(1), lambda: False], timeout=0.05, backoff=Backoff(0.01))
+    stats = excinfo.value.stats
+    assert stats[0].ok is True
+    assert stats[1].ok is False
+    assert stats[1].attempts > 1
+
+
+def test_async_wait_all():
+    async def async_cond():
+        return True
+
+    stats = asyncio.run(async_wait_all([async_cond, Counter(2)],
+                                       backoff=Backoff(0.001)))
+    assert all(s.ok for s in stats)
+
+
+def test_wait_till_true_compat():
+    cond = Counter(2)
+    wait_till_true(interval=0.001)(cond)
+    assert cond.calls == 2
@@ -0,0 +1,99 @@
+import asyncio
+
+import aiohttp
+import structlog
+
+from .clients import PdOperatorMixin
+
+
+log = structlog.get_logger()
+
+
+class AsyncPdClient(PdOperatorMixin):
+    """asyncio version of PdClient, based on aiohttp
+
+    Batched calls (add_operators, get_regions) fan out concurrently,
+    at most `concurrency` requests are in flight at the same time::
+
+        async with AsyncPdClient() as pd:
+            await pd.add_operators([Op.transfer_leader(left, 1),
+                                    Op.transfer_leader(right, 1)])
+    """
+
+    def __init__(self, url='http://127.0.0.1:2379', concurrency=16, timeout=10):
+        self._url = url
+        self._pd_api = f'{url}/pd/api/v1'
+        self._concurrency = concurrency
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._sem = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @property
+    def session(self):
+        # the session and the semaphore must be created inside the event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._concurrency)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=self._timeout)
+            self._sem = asyncio.Semaphore(self._concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, url, **kwargs):
+        """send a request, return (status, parsed json or text)"""
+        session = self.session
+        async with self._sem:
+            async with session.request(method, url, **kwargs) as resp:
+                if resp.content_type == 'application/json':
+                    return resp.status, await resp.json()
+                return resp.status, await resp.text()
+
+    async def _add_operator(self, js):
+        log.msg('add opereator', **js)
+        status, body = await self._request('POST', f'{self._pd_api}/operators', json=js)
+        if status == 200:
+            return True
+        log.debug(f'failed: {body}', **js)
+        return False
+
+    async def add_operators(self, ops):
+        """submit operators concurrently, return a list of bool in order"""
+        return await asyncio.gather(*[self._add_operator(js) for js in ops])
+
+    async def config_set(self, key, value):
+        js = {
+            key: value
+        }
+        status, _ = await self._request('POST', f'{self._pd_api}/config', json=js)
+        return status == 200
+
+    async def get_region(self, region_id):
+        _, js = await self._request('GET', f'{self._pd_api}/region/id/{region_id}')
+        return js
+
+    async def get_regions(self, region_ids):
+        """get regions concurrently, return a list of regions in order"""
+        return await asyncio.gather(*[self.get_region(region_id)
+                                      for region_id in region_ids])
+
+    async def list_stores(self):
+        _, js = await self._request('GET', f'{self._pd_api}/stores')
+        return js['stores']
+
+    async def apply_placement_rule(self, js):
+        log.msg(f'apply placement rule', rule=js)
+        status, body = await self._request('POST', f'{self._pd_api}/config/rule', json=js)
+        if status == 200:
+            return True
+        log.debug(f'failed: {body}')
+        return False
@@ -0,0 +1,97 @@
+import bisect
+import threading
+import time
+
+
+class RegionCache:
+    """local cache of PD regions and stores with TTL eviction
+
+    Regions are indexed by region id and by start key, so the region
+    which contains an encoded key can be found with a binary search.
+    Keys are bytes, the hex keys in PD responses are converted.
+    It is safe to share one cache between threads.
+    """
+
+    def __init__(self, ttl=5, clock=time.monotonic):
+        self._ttl = ttl
+        self._clock = clock
+        self._regions = {}  # {region_id: (expire_at, start_key, end_key, region)}
+        self._starts = []  # sorted start keys of cached regions
+        self._start_to_id = {}  # {start_key: region_id}
+        self._stores = None  # (expire_at, stores)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def put_region(self, region):
+        with self._lock:
+            region_id = region['id']
+            self.invalidate_region(region_id)
+            start_key = bytes.fromhex(region.get('start_key', ''))
+            end_key = bytes.fromhex(region.get('end_key', ''))
+            # a stale region may still own the start key, e.g. before a merge
+            stale_id = self._start_to_id.get(start_key)
+            if stale_id is not None:
+                self.invalidate_region(stale_id)
+            self._regions[region_id] = (self._clock() + self._ttl, start_key, end_key, region)
+            bisect.insort(self._starts, start_key)
+            self._start_to_id[start_key] = region_id
+
+    def get_region(self, region_id):
+        with self._lock:
+            item = self._regions.get(region_id)
+            if item is None or item[0] <= self._clock():
+                if item is not None:
+                    self.invalidate_region(region_id)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[3]
+
+    def get_region_by_key(self, key: bytes):
+        with self._lock:
+            i = bisect.bisect_right(self._starts, key) - 1
+            if i >= 0:
+                region_id = self._start_to_id[self._starts[i]]
+                _, _, end_key, _ = self._regions[region_id]
+                # an empty end key means +inf
+                if not end_key or key < end_key:
+                    return self.get_region(region_id)
+            self.misses += 1
+            return None
+
+    def invalidate_region(self, region_id):
+        with self._lock:
+            item = self._regions.pop(region_id, None)
+            if item is None:
+                return
+            start_key = item[1]
+            i = bisect.bisect_left(self._starts, start_key)
+            if i < len(self._starts) and self._starts[i] == start_key:
+                del self._starts[i]
+            if self._start_to_id.get(start_key) == region_id:
+                del self._start_to_id[start_key]
+
+    def put_stores(self, stores):
+        with self._lock:
+            self._stores = (self._clock() + self._ttl, stores)
+
+    def get_stores(self):
+        with self._lock:
+            if self._stores is None or self._stores[0] <= self._clock():
+                self._stores = None
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._stores[1]
+
+    def invalidate_stores(self):
+        with self._lock:
+            self._stores = None
+
+    def clear(self):
+        with self._lock:
+            self._regions.clear()
+            self._starts.clear()
+            self._start_to_id.clear()
+            self._stores = None
@@ -1,88 +1,200 @@
-import time
+import random
 from collections import namedtuple
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 
 import requests
 import pymysql
 import structlog
+from requests.adapters import HTTPAdapter
+
+from .cache import RegionCache
+from .wait import Backoff, wait_until
 
 
 log = structlog.get_logger()
 
 
-def new_sql_conn(db_uri='mysql://root@127.0.0.1:4000'):
-    """
-    1. random choose one connection info
-    2. create a connection and use test database
+def parse_db_uris(db_uri):
+    """split comma separated uris
+
+    >>> parse_db_uris('mysql://root@h1:4000, mysql://root@h2:4000')
+    ['mysql://root@h1:4000', 'mysql://root@h2:4000']
     """
+    if isinstance(db_uri, str):
+        db_uri = db_uri.split(',')
+    return [uri.strip() for uri in db_uri if uri.strip()]
+
+
+def connect_sql(db_uri, **kwargs):
+    """create a connection to one db uri and use test database"""
     result = urlparse(db_uri)
     return pymysql.connect(host=result.hostname,
                            port=result.port,
                            user=result.username,
                            password=result.password or '',
 
-                           db='test',
+                           db=kwargs.pop('db', 'test'),
                            charset='utf8mb4',
-                           cursorclass=pymysql.cursors.DictCursor)
+                           cursorclass=pymysql.cursors.DictCursor,
+                           **kwargs)
+
+
+def new_sql_conn(db_uri='mysql://root@127.0.0.1:4000', **kwargs):
+    """
+    1. random choose one connection info
+    2. create a connection and use test database
+
+    :param db_uri: one uri, comma separated uris or a list of uris.
+        See tilo.sql_pool.SqlPool for pooled connections.
+    """
+    return connect_sql(random.choice(parse_db_uris(db_uri)), **kwargs)
 
 
-def wait_till_true(interval=1):
+def wait_till_true(interval=1, timeout=None):
+    """poll func with a fixed interval, see tilo.wait for backoff and
+    waiting on many conditions"""
     def wrapper(func, *args, **kwargs):
-        while True:
-         if func(*args, **kwargs) is True:
-             break
-         time.sleep(interval)
+        return wait_until(lambda: func(*args, **kwargs), timeout=timeout,
+                          backoff=Backoff(interval, factor=1))
     return wrapper
 
 
-class PdClient:
-    def __init__(self, url='http://127.0.0.1:2379'):
+class HttpClient:
+    """base of the http api clients, requests share one keep-alive session
+
+    :param pool_size: max connections kept alive for the host
+    :param timeout: (connect timeout, read timeout) in seconds
+    """
+
+    def __init__(self, url, pool_size=10, timeout=(3, 10)):
         self._url = url
-        self._pd_api = f'{url}/pd/api/v1'
+        self._timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
 
-    def add_learner(self, region_id, store_id):
-        js = {
+    def _get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self._timeout)
+        return self._session.get(url, **kwargs)
+
+    def _post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self._timeout)
+        return self._session.post(url, **kwargs)
+
+    def connection_stats(self):
+        """return how many connections are opened and how many requests
+        reuse an opened connection"""
+        opened = requests_count = 0
+        # the same adapter is mounted for both http and https
+        adapters = {id(adapter): adapter for adapter in self._session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                requests_count += pool.num_requests
+        return {'opened': opened, 'reused': requests_count - opened}
+
+    def close(self):
+        self._session.close()
+
+
+class Op:
+    """builders of PD operators, which can be submitted with add_operators"""
+
+    @staticmethod
+    def add_learner(region_id, store_id):
+        return {
             'name': 'add-learner',
             'region_id': region_id,
             'store_id': store_id,
         }
-        return self._add_operator(js)
 
-    def add_peer(self, region_id, store_id):
-        js = {
+    @staticmethod
+    def add_peer(region_id, store_id):
+        return {
             'name': 'add-peer',
             'region_id': region_id,
             'store_id': store_id,
         }
-        return self._add_operator(js)
 
-    def remove_peer(self, region_id, store_id):
-        js = {
+    @staticmethod
+    def remove_peer(region_id, store_id):
+        return {
             'name': 'remove-peer',
             'region_id': region_id,
             'store_id': store_id,
         }
-        return self._add_operator(js)
 
-    def merge_region(self, source_region_id, target_region_id):
-        js = {
+    @staticmethod
+    def merge_region(source_region_id, target_region_id):
+        return {
             'name': 'merge-region',
             'source_region_id': source_region_id,
             'target_region_id': target_region_id,
         }
-        return self._add_operator(js)
 
-    def transfer_leader(self, region_id, store_id):
-        js = {
+    @staticmethod
+    def transfer_leader(region_id, store_id):
+        return {
             'name': 'transfer-leader',
             'region_id': region_id,
             'to_store_id': store_id,
         }
-        return self._add_operator(js)
+
+
+class PdOperatorMixin:
+    """operator shortcuts shared by PdClient and AsyncPdClient
+
+    The subclass implements _add_operator, the shortcuts return whatever
+    it returns, a bool for PdClient and a coroutine for AsyncPdClient.
+    """
+
+    def add_learner(self, region_id, store_id):
+        return self._add_operator(Op.add_learner(region_id, store_id))
+
+    def add_peer(self, region_id, store_id):
+        return self._add_operator(Op.add_peer(region_id, store_id))
+
+    def remove_peer(self, region_id, store_id):
+        return self._add_operator(Op.remove_peer(region_id, store_id))
+
+    def merge_region(self, source_region_id, target_region_id):
+        return self._add_operator(Op.merge_region(source_region_id, target_region_id))
+
+    def transfer_leader(self, region_id, store_id):
+        return self._add_operator(Op.transfer_leader(region_id, store_id))
+
+
+class PdClient(PdOperatorMixin, HttpClient):
+    """
+    :param cache_ttl: cache regions and stores for cache_ttl seconds,
+        the cache is disabled by default. Regions touched by an operator
+        and all stores are invalidated before and after the operator is
+        submitted.
+    """
+
+    def __init__(self, url='http://127.0.0.1:2379', cache_ttl=None, **kwargs):
+        super().__init__(url, **kwargs)
+        self._pd_api = f'{url}/pd/api/v1'
+        self.cache = RegionCache(cache_ttl) if cache_ttl else None
+
+    def _invalidate_operator(self, js):
+        if self.cache is None:
+            return
+        for field in ('region_id', 'source_region_id', 'target_region_id'):
+            if field in js:
+                self.cache.invalidate_region(js[field])
+        self.cache.invalidate_stores()
 
     def _add_operator(self, js):
         log.msg('add opereator', **js)
-        resp = requests.post(f'{self._pd_api}/operators', json=js)
+        self._invalidate_operator(js)
+        resp = self._post(f'{self._pd_api}/operators', json=js)
+        # a lookup running concurrently with the POST may have cached
+        # the region as it was before the operator, drop it again
+        self._invalidate_operator(js)
         if resp.status_code == 200:
             return True
         log.debug(f'failed: {resp.text}', **js)
@@ -92,22 +204,46 @@ class PdClient:
         js = {
             key: value
         }
-        resp = requests.post(f'{self._pd_api}/config', json=js)
+        resp = self._post(f'{self._pd_api}/config', json=js)
         return resp.status_code == 200
 
     def get_region(self, region_id):
-        resp = requests.get(f'{self._pd_api}/region/id/{region_id}')
+        if self.cache is not None:
+            region = self.cache.get_region(region_id)
+            if region is not None:
+                return region
+        resp = self._get(f'{self._pd_api}/region/id/{region_id}')
         js = resp.json()
+        if self.cache is not None and js and js.get('id'):
+            self.cache.put_region(js)
+        return js
+
+    def get_region_by_key(self, key: bytes):
+        """get the region which contains the encoded key"""
+        if self.cache is not None:
+            region = self.cache.get_region_by_key(key)
+            if region is not None:
+                return region
+        resp = self._get(f'{self._pd_api}/region/key/{quote(bytes(key), safe="")}')
+        js = resp.json()
+        if self.cache is not None and js and js.get('id'):
+            self.cache.put_region(js)
         return js
 
     def list_stores(self):
-        resp = requests.get(f'{self._pd_api}/stores')
+        if self.cache is not None:
+            stores = self.cache.get_stores()
+            if stores is not None:
+                return stores
+        resp = self._get(f'{self._pd_api}/stores')
         js = resp.json()
+        if self.cache is not None:
+            self.cache.put_stores(js['stores'])
         return js['stores']
 
     def apply_placement_rule(self, js):
         log.msg(f'apply placement rule', rule=js)
-        resp = requests.post(f'{self._pd_api}/config/rule', json=js)
+        resp = self._post(f'{self._pd_api}/config/rule', json=js)
         if resp.status_code == 200:
             return True
         log.debug(f'failed: {resp.text}')
@@ -117,19 +253,29 @@ class PdClient:
 PlaygroundInstance = namedtuple('PlaygroundInstance', ['pid', 'role', 'uptime', 'port'])
 
 
-class PlaygroundClient:
-    def __init__(self, url='http://127.0.0.1:9527'):
-        self._url = url
+def parse_display(text):
+    """parse the output of playground display command, the first two
+    lines are the header and the separator
+
+    >>> parse_display('Pid Role Uptime Port\\n--- ---- ------ ----\\n'
+    ...               '101 tikv 1m0s 20160\\n')
+    [PlaygroundInstance(pid='101', role='tikv', uptime='1m0s', port='20160')]
+    """
+    instances = []
+    for line in text.split('\n')[2:]:
+        parts = line.split()
+        if len(parts) == 4:
+            instances.append(PlaygroundInstance(*parts))
+    return instances
+
+
+class PlaygroundClient(HttpClient):
+    def __init__(self, url='http://127.0.0.1:9527', **kwargs):
+        super().__init__(url, **kwargs)
 
     def list_instances(self):
         resp = self._send_command('display')
-        instances = []
-        for line in resp.text.split('\n')[2:]:
-            parts = line.split()
-            if len(parts) == 4:
-                instance = PlaygroundInstance(*parts)
-                instances.append(instance)
-        return instances
+        return parse_display(resp.text)
 
     def partition(self, pid):
         resp = self._send_command('partition', pid)
@@ -145,4 +291,4 @@ class PlaygroundClient:
         }
         if pid is not None:
             js['PID'] = int(pid)
-        return requests.post(f'{self._url}/command', json=js)
+        return self._post(f'{self._url}/command', json=js)
@@ -1,29 +1,208 @@
 import sys
 
+from .excs import DecodeError, InsufficientBytesError
+
 
 ENC_GROUP_SIZE = 8
 ENC_MARKER = b'\xFF'
 ENC_PAD = b'\x00'
 PADS = b'\x00' * ENC_GROUP_SIZE
 
+# ENC_MARKERS[pad_count] is the marker byte of a group padded with pad_count
+ENC_MARKERS = [
+    (int.from_bytes(ENC_MARKER, sys.byteorder, signed=False) - pad_count)
+    .to_bytes(1, sys.byteorder, signed=False)
+    for pad_count in range(ENC_GROUP_SIZE + 1)
+]
+# the last group of data with remain bytes, padding and marker included
+ENC_TAILS = [PADS[:ENC_GROUP_SIZE - remain] + ENC_MARKERS[ENC_GROUP_SIZE - remain]
+             for remain in range(ENC_GROUP_SIZE)]
+ENC_FULL_GROUP_MARKER = ENC_MARKERS[0]
+
+
+def encoded_bytes_len(d_len: int) -> int:
+    """
+    >>> encoded_bytes_len(0)
+    9
+    >>> encoded_bytes_len(8)
+    18
+    """
+    return (d_len // ENC_GROUP_SIZE + 1) * (ENC_GROUP_SIZE + 1)
+
 
 def encode_bytes(b: bytes, data: bytes) -> bytes:
+    """
+    >>> encode_bytes(b'', b'abc').hex()
+    '6162630000000000fa'
+    """
+    ba = bytearray(b)
+    _encode_bytes_into(ba, data)
+    return ba
+
+
+def _encode_bytes_into(ba: bytearray, data: bytes):
     d_len = len(data)
+    full = d_len - d_len % ENC_GROUP_SIZE
+    for i in range(0, full, ENC_GROUP_SIZE):
+        ba += data[i:i+ENC_GROUP_SIZE]
+        ba += ENC_FULL_GROUP_MARKER
+    ba += data[full:]
+    ba += ENC_TAILS[d_len - full]
+
+
+def _encode_same_len(datas, d_len: int) -> bytearray:
+    """encodes data of the same length column by column
+
+    All encoded values share one layout, so every data byte column and
+    every marker column can be written with one strided slice assignment.
+    """
+    n = len(datas)
+    e_len = encoded_bytes_len(d_len)
+    block = bytearray(n * e_len)
+    joined = b''.join(datas)
+    for j in range(d_len):
+        dst = j // ENC_GROUP_SIZE * (ENC_GROUP_SIZE + 1) + j % ENC_GROUP_SIZE
+        block[dst::e_len] = joined[j::d_len]
+    for g in range(d_len // ENC_GROUP_SIZE):
+        block[g * (ENC_GROUP_SIZE + 1) + ENC_GROUP_SIZE::e_len] = ENC_FULL_GROUP_MARKER * n
+    block[e_len - 1::e_len] = ENC_TAILS[d_len % ENC_GROUP_SIZE][-1:] * n
+    return block
+
+
+def encode_bytes_many(datas) -> (bytearray, list):
+    """encodes a batch of data into one preallocated buffer
+
+    It returns the buffer and the offsets, the i-th encoded value
+    is buf[offsets[i]:offsets[i+1]].
+
+    >>> buf, offsets = encode_bytes_many([b'abc', b''])
+    >>> offsets
+    [0, 9, 18]
+    >>> bytes(buf[offsets[0]:offsets[1]]) == encode_bytes(b'', b'abc')
+    True
+    """
+    buckets = {}  # {data length: [index, ]}
+    offsets = [0]
+    total = 0
+    for i, data in enumerate(datas):
+        d_len = len(data)
+        buckets.setdefault(d_len, []).append(i)
+        total += encoded_bytes_len(d_len)
+        offsets.append(total)
+
+    # keys built for one table usually have the same length
+    if len(buckets) == 1:
+        d_len, = buckets
+        return _encode_same_len(datas, d_len), offsets
 
+    buf = bytearray(total)
+    mv = memoryview(buf)
+    for d_len, indexes in buckets.items():
+        e_len = encoded_bytes_len(d_len)
+        block = memoryview(_encode_same_len([datas[i] for i in indexes], d_len))
+        for k, i in enumerate(indexes):
+            mv[offsets[i]:offsets[i + 1]] = block[k * e_len:(k + 1) * e_len]
+    return buf, offsets
+
+
+def decode_bytes(b) -> (memoryview, bytes):
+    """decodes value encoded by encode_bytes before
+
+    It returns the leftover un-decoded slice, decoded value if no error.
+    The leftover slice is a memoryview of b, so nothing is copied.
+
+    >>> rest, data = decode_bytes(encode_bytes(b'', b'abc') + b'tail')
+    >>> data, bytes(rest)
+    (b'abc', b'tail')
+    """
+    mv = memoryview(b)
+    b_len = len(mv)
+    parts = []
     i = 0
-    ba = bytearray(b)
-    while i <= d_len:
-        remain = d_len - i
-        pad_count = 0
-        if remain >= ENC_GROUP_SIZE:
-            ba.extend(data[i:i+ENC_GROUP_SIZE])
-        else:
-            pad_count = ENC_GROUP_SIZE - remain
-            ba.extend(data[i:])
-            ba.extend(PADS[:pad_count])
-        num = int.from_bytes(ENC_MARKER, sys.byteorder, signed=False)
-        marker = (num - pad_count).to_bytes(1, sys.byteorder, signed=False)
-        ba.extend(marker)
-
-        i += ENC_GROUP_SIZE
-    return ba
+    while True:
+        marker_pos = i + ENC_GROUP_SIZE
+        if marker_pos >= b_len:
+            raise InsufficientBytesError
+        pad_count = 0xFF - mv[marker_pos]
+        if pad_count == 0:
+            parts.append(mv[i:marker_pos])
+            i = marker_pos + 1
+            continue
+        if pad_count > ENC_GROUP_SIZE:
+            raise DecodeError(f'invalid marker byte at {marker_pos}')
+        data_end = marker_pos - pad_count
+        if mv[data_end:marker_pos] != PADS[:pad_count]:
+            raise DecodeError(f'invalid padding bytes at {data_end}')
+        parts.append(mv[i:data_end])
+        return mv[marker_pos + 1:], b''.join(parts)
+
+
+def _decode_same_len(joined, n: int, k_len: int):
+    """decodes n keys of k_len bytes column by column
+
+    It returns None when the keys do not share one encoded layout,
+    the caller should fall back to decode them one by one.
+    """
+    g_len = ENC_GROUP_SIZE + 1
+    g = 0
+    while True:
+        marker_pos = g * g_len + ENC_GROUP_SIZE
+        if marker_pos >= k_len:
+            return None
+        markers = joined[marker_pos::k_len]
+        if markers == ENC_FULL_GROUP_MARKER * n:
+            g += 1
+            continue
+        if markers != markers[:1] * n:
+            return None
+        pad_count = 0xFF - markers[0]
+        if pad_count > ENC_GROUP_SIZE:
+            return None
+        for pad_pos in range(marker_pos - pad_count, marker_pos):
+            if joined[pad_pos::k_len] != ENC_PAD * n:
+                return None
+        break
+
+    d_len = g * ENC_GROUP_SIZE + ENC_GROUP_SIZE - pad_count
+    decoded = bytearray(n * d_len)
+    for j in range(d_len):
+        src = j // ENC_GROUP_SIZE * g_len + j % ENC_GROUP_SIZE
+        decoded[j::d_len] = joined[src::k_len]
+    return decoded, d_len, marker_pos + 1
+
+
+def decode_bytes_many(keys) -> (list, list):
+    """decodes a column of keys encoded by encode_bytes
+
+    It returns the decoded values and the leftover slices (memoryviews)
+    of each key. When all keys share one encoded layout, which is the
+    common case for keys of one table, the column is decoded in one pass
+    with strided slices instead of a python loop per key.
+
+    >>> keys = [encode_bytes(b'', b'k%d' % i) + b'ts' for i in range(3)]
+    >>> values, rests = decode_bytes_many(keys)
+    >>> values, [bytes(rest) for rest in rests]
+    ([b'k0', b'k1', b'k2'], [b'ts', b'ts', b'ts'])
+    """
+    n = len(keys)
+    if n == 0:
+        return [], []
+    k_len = len(keys[0])
+    if all(len(key) == k_len for key in keys):
+        joined = b''.join(keys)
+        result = _decode_same_len(joined, n, k_len)
+        if result is not None:
+            decoded, d_len, e_len = result
+            mv = memoryview(joined)
+            values = [bytes(decoded[i:i + d_len])
+                      for i in range(0, n * d_len, d_len)]
+            rests = [mv[i + e_len:i + k_len] for i in range(0, n * k_len, k_len)]
+            return values, rests
+
+    values = []
+    rests = []
+    for key in keys:
+        rest, value = decode_bytes(key)
+        values.append(value)
+        rests.append(rest)
+    return values, rests
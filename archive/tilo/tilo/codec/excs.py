@@ -1,4 +1,4 @@
-class CodecError:
+class CodecError(Exception):
     pass
 
 
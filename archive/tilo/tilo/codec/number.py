@@ -42,6 +42,22 @@ def encode_int(b: bytes, v: int) -> bytes:
     return b + u.to_bytes(8, byteorder='big', signed=False)
 
 
+def decode_int(b: bytes) -> (bytes, int):
+    """decodes value encoded by encode_int before
+
+    It returns the leftover un-decoded slice, decoded value if no error.
+
+    >>> decode_int(encode_int(b'', -2) + b'x')
+    (b'x', -2)
+    """
+    if len(b) < 8:
+        raise InsufficientBytesError
+    u = int.from_bytes(b[:8], byteorder='big', signed=False) ^ i64_sign_mask
+    if u & i64_sign_mask:
+        u -= 1 << 64
+    return b[8:], u
+
+
 def decode_uint_desc(b: bytes) -> (bytes, int):
     """decodes value encoded by encode_int before
 
@@ -52,3 +68,21 @@ def decode_uint_desc(b: bytes) -> (bytes, int):
     data = b[:8]
     v = int.from_bytes(data, byteorder='big', signed=False)
     return b[8:], (~v & 0xffffffffffffffff)
+
+
+def decode_var_uint(b: bytes) -> (bytes, int):
+    """decodes value encoded as varint (LEB128), like TiKV encode_var_u64
+
+    It returns the leftover un-decoded slice, decoded value if no error.
+
+    >>> decode_var_uint(bytes([0xac, 0x02, 0x01]))
+    (b'\\x01', 300)
+    """
+    v = 0
+    shift = 0
+    for i, byte in enumerate(b[:10]):
+        v |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return b[i+1:], v
+        shift += 7
+    raise InsufficientBytesError
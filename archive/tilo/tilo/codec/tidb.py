@@ -1,5 +1,28 @@
-from .number import encode_int
-from .bytes_ import encode_bytes
+from collections import namedtuple
+
+from .excs import DecodeError, InsufficientBytesError
+from .number import encode_int, decode_int, decode_uint_desc, i64_sign_mask
+from .bytes_ import encode_bytes, decode_bytes, ENC_GROUP_SIZE
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the *_np helpers need it
+    np = None
+
+
+TABLE_PREFIX = b't'
+ROW_PREFIX_SEP = b'_r'
+INDEX_PREFIX_SEP = b'_i'
+ROW_KIND = ord('r')
+INDEX_KIND = ord('i')
+
+TS_LEN = 8
+# t{table_id}_r{row_id} or t{table_id}_i{index_id}, the fixed part of keys
+KEY_HEAD_LEN = len(TABLE_PREFIX) + 8 + len(ROW_PREFIX_SEP) + 8
+# memcomparable encoded length of the fixed part
+ENC_KEY_HEAD_LEN = (KEY_HEAD_LEN // ENC_GROUP_SIZE + 1) * (ENC_GROUP_SIZE + 1)
+
+DecodedKeys = namedtuple('DecodedKeys', ['table_id', 'kind', 'handle', 'ts'])
 
 
 def encode_int_row_key(table_id: int, row_id: int) -> bytes:
@@ -14,3 +37,99 @@ def encode_int_row_key(table_id: int, row_id: int) -> bytes:
     result.extend(b'_r')
     result.extend(encode_int(b'', row_id))
     return encode_bytes(b'', result)
+
+
+def decode_key(key: bytes, with_ts=True) -> (int, int, int, int):
+    """decodes one memcomparable encoded row key or index key
+
+    It returns (table_id, kind, handle, ts). The handle is the row id
+    for row keys and the index id for index keys, ts is 0 if the key
+    has no ts suffix.
+
+    >>> decode_key(encode_int_row_key(11, 10), with_ts=False)
+    (11, 114, 10, 0)
+    """
+    rest, user_key = decode_bytes(key)
+    ts = 0
+    if with_ts:
+        _, ts = decode_uint_desc(rest)
+    if len(user_key) < KEY_HEAD_LEN:
+        raise InsufficientBytesError
+    if user_key[:1] != TABLE_PREFIX:
+        raise DecodeError('invalid table prefix')
+    rest, table_id = decode_int(user_key[1:])
+    sep = rest[:2]
+    if sep != ROW_PREFIX_SEP and sep != INDEX_PREFIX_SEP:
+        raise DecodeError(f'invalid key type {sep!r}')
+    _, handle = decode_int(rest[2:])
+    return table_id, sep[1], handle, ts
+
+
+def decode_keys_np(keys, offsets=None, with_ts=True) -> DecodedKeys:
+    """decodes a batch of row keys and index keys into numpy arrays
+
+    keys is either a list of keys, or a contiguous buffer of keys with
+    offsets like what encode_bytes_many returns. Only the fixed part of
+    the keys (table id, key type and the int handle or index id) and the
+    ts suffix are decoded; index values can be decoded from the original
+    key with decode_bytes when needed.
+
+    >>> keys = [encode_int_row_key(11, 10), encode_int_row_key(-1, 2)]
+    >>> decoded = decode_keys_np(keys, with_ts=False)
+    >>> decoded.table_id.tolist(), decoded.handle.tolist()
+    ([11, -1], [10, 2])
+    """
+    if np is None:
+        raise RuntimeError('numpy is required, please install it first')
+
+    if offsets is None:
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(key) for key in keys), dtype=np.int64,
+                              count=len(keys)), out=offsets[1:])
+        keys = b''.join(keys)
+    buf = np.frombuffer(keys, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts, ends = offsets[:-1], offsets[1:]
+
+    min_len = ENC_KEY_HEAD_LEN + (TS_LEN if with_ts else 0)
+    short = np.flatnonzero(ends - starts < min_len)
+    if short.size:
+        raise InsufficientBytesError(f'key {short[0]} is too short')
+
+    # gather the raw bytes of the fixed part, raw byte j is at
+    # (j // 8) * 9 + j % 8 of the encoded key
+    raw_idx = np.array([j // ENC_GROUP_SIZE * (ENC_GROUP_SIZE + 1) + j % ENC_GROUP_SIZE
+                        for j in range(KEY_HEAD_LEN)], dtype=np.int64)
+    raw = buf[starts[:, None] + raw_idx]
+    # the first groups are full, the group holding the end of the fixed
+    # part must have at least its last byte, 16-18 byte keys fail here
+    n_full = KEY_HEAD_LEN // ENC_GROUP_SIZE
+    marker_idx = np.arange(1, n_full + 1, dtype=np.int64) * (ENC_GROUP_SIZE + 1) - 1
+    markers = buf[starts[:, None] + marker_idx]
+    max_pad = (n_full + 1) * ENC_GROUP_SIZE - KEY_HEAD_LEN
+    last_marker = buf[starts + (n_full + 1) * (ENC_GROUP_SIZE + 1) - 1]
+
+    kind = raw[:, 10]
+    invalid = ((raw[:, 0] != TABLE_PREFIX[0])
+               | (raw[:, 9] != ord('_'))
+               | ((kind != ROW_KIND) & (kind != INDEX_KIND))
+               | (markers != 0xFF).any(axis=1)
+               | (last_marker < 0xFF - max_pad))
+    invalid = np.flatnonzero(invalid)
+    if invalid.size:
+        raise DecodeError(f'key {invalid[0]} is not a row key or index key')
+
+    sign = np.uint64(i64_sign_mask)
+    table_id = (_be_uint64(raw[:, 1:9]) ^ sign).view(np.int64)
+    handle = (_be_uint64(raw[:, 11:19]) ^ sign).view(np.int64)
+    if with_ts:
+        ts_bytes = buf[ends[:, None] - TS_LEN + np.arange(TS_LEN)]
+        ts = ~_be_uint64(ts_bytes)
+    else:
+        ts = np.zeros(len(starts), dtype=np.uint64)
+    return DecodedKeys(table_id, kind.copy(), handle, ts)
+
+
+def _be_uint64(cols):
+    """converts a (n, 8) uint8 array of big endian bytes to uint64"""
+    return np.ascontiguousarray(cols).view('>u8').ravel().astype(np.uint64)
@@ -1,11 +1,187 @@
-from .number import decode_uint_desc
+from collections import namedtuple
+
+from .excs import DecodeError, InsufficientBytesError
+from .number import decode_uint_desc, decode_var_uint
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the *_np helpers need it
+    np = None
+
+
+TS_LEN = 8
+
+WRITE_TYPE_PUT = ord('P')
+WRITE_TYPE_DELETE = ord('D')
+WRITE_TYPE_LOCK = ord('L')
+WRITE_TYPE_ROLLBACK = ord('R')
+WRITE_TYPES = {
+    WRITE_TYPE_PUT: 'put',
+    WRITE_TYPE_DELETE: 'delete',
+    WRITE_TYPE_LOCK: 'lock',
+    WRITE_TYPE_ROLLBACK: 'rollback',
+}
+
+SHORT_VALUE_PREFIX = ord('v')
+# a varint u64 takes at most 10 bytes
+MAX_VAR_UINT_LEN = 10
+
+WriteRecord = namedtuple('WriteRecord', ['write_type', 'start_ts', 'short_value'])
+# write_type: uint8, start_ts: uint64, short_value_len: int32 (-1 means no short value)
+WriteRecords = namedtuple('WriteRecords', ['write_type', 'start_ts', 'short_value_len'])
 
 
 def decode_write_key(key: bytes):
-    ts_len = 8
-    if len(key) < ts_len:
+    if len(key) < TS_LEN:
         raise InsufficientBytesError
-    ts_bytes = key[-ts_len:]
-    user_key = key[:-ts_len]
-    _, ts = decode_uint_desc(user_key)
+    ts_bytes = key[-TS_LEN:]
+    user_key = key[:-TS_LEN]
+    _, ts = decode_uint_desc(ts_bytes)
     return user_key, ts
+
+
+def decode_write(value: bytes) -> WriteRecord:
+    """decodes one value of the write cf
+
+    The layout is write type (1 byte), start_ts (varint) and optional
+    fields, the short value field is 'v' + length (1 byte) + value.
+
+    >>> decode_write(b'P\\x01v\\x02ab')
+    WriteRecord(write_type=80, start_ts=1, short_value=b'ab')
+    """
+    if len(value) < 2:
+        raise InsufficientBytesError
+    write_type = value[0]
+    if write_type not in WRITE_TYPES:
+        raise DecodeError(f'invalid write type {write_type}')
+    rest, start_ts = decode_var_uint(value[1:])
+    short_value = None
+    if rest[:1] == b'v':
+        if len(rest) < 2 or len(rest) < 2 + rest[1]:
+            raise InsufficientBytesError
+        short_value = rest[2:2 + rest[1]]
+    return WriteRecord(write_type, start_ts, short_value)
+
+
+def decode_writes_np(values, offsets=None) -> WriteRecords:
+    """decodes a batch of write cf values into numpy arrays
+
+    values is either a list of values, or a contiguous buffer of values
+    with offsets. Only the write type, start_ts and the short value length
+    are decoded, all in a few vectorized passes.
+
+    >>> records = decode_writes_np([b'P\\x01v\\x02ab', b'D\\xac\\x02'])
+    >>> [WRITE_TYPES[t] for t in records.write_type.tolist()]
+    ['put', 'delete']
+    >>> records.start_ts.tolist(), records.short_value_len.tolist()
+    ([1, 300], [2, -1])
+    """
+    if np is None:
+        raise RuntimeError('numpy is required, please install it first')
+
+    if offsets is None:
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(value) for value in values), dtype=np.int64,
+                              count=len(values)), out=offsets[1:])
+        values = b''.join(values)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts, ends = offsets[:-1], offsets[1:]
+    n = len(starts)
+    if n == 0:
+        return WriteRecords(np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint64),
+                            np.zeros(0, dtype=np.int32))
+
+    # write type, varint start_ts, short value prefix and its length byte
+    width = 1 + MAX_VAR_UINT_LEN + 2
+    buf = np.frombuffer(values, dtype=np.uint8)
+    if buf.size == 0:
+        raise InsufficientBytesError('all values are empty')
+    idx = starts[:, None] + np.arange(width)
+    in_range = idx < ends[:, None]
+    head = np.where(in_range, buf[np.minimum(idx, len(buf) - 1)], 0)
+
+    write_type = head[:, 0].copy()
+    invalid = np.flatnonzero(~np.isin(write_type, list(WRITE_TYPES)) | ~in_range[:, 1])
+    if invalid.size:
+        raise DecodeError(f'value {invalid[0]} is not a valid write')
+
+    # the varint ends at the first byte without the continuation bit
+    var_bytes = head[:, 1:1 + MAX_VAR_UINT_LEN]
+    terminal = (var_bytes < 0x80) & in_range[:, 1:1 + MAX_VAR_UINT_LEN]
+    unterminated = np.flatnonzero(~terminal.any(axis=1))
+    if unterminated.size:
+        raise InsufficientBytesError(f'value {unterminated[0]} has a truncated start_ts')
+    var_len = terminal.argmax(axis=1) + 1
+    shifts = np.arange(MAX_VAR_UINT_LEN, dtype=np.uint64) * np.uint64(7)
+    groups = (var_bytes & 0x7f).astype(np.uint64) << shifts
+    groups[np.arange(MAX_VAR_UINT_LEN) >= var_len[:, None]] = 0
+    start_ts = np.bitwise_or.reduce(groups, axis=1)
+
+    rows = np.arange(n)
+    flag_pos = 1 + var_len
+    has_short_value = (head[rows, flag_pos] == SHORT_VALUE_PREFIX) & in_range[rows, flag_pos + 1]
+    short_value_len = np.where(has_short_value,
+                               head[rows, flag_pos + 1].astype(np.int32),
+                               np.int32(-1))
+    return WriteRecords(write_type, start_ts, short_value_len)
+
+
+class WriteHistogram:
+    """accumulates write cf statistics over batches of WriteRecords
+
+    >>> hist = WriteHistogram()
+    >>> hist.add(decode_writes_np([b'P\\x01v\\x02ab', b'D\\x01', b'D\\x02']))
+    >>> hist.counts['delete'], hist.total
+    (2, 3)
+    """
+
+    # short value length is one byte, bucket it by power of 2
+    SHORT_VALUE_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+    def __init__(self):
+        self.total = 0
+        self.counts = {name: 0 for name in WRITE_TYPES.values()}
+        self.short_value_counts = {name: 0 for name in WRITE_TYPES.values()}
+        self.short_value_hist = [0] * (len(self.SHORT_VALUE_BUCKETS) - 1)
+
+    def add(self, records: WriteRecords):
+        self.total += len(records.write_type)
+        type_counts = np.bincount(records.write_type, minlength=256)
+        with_short_value = records.write_type[records.short_value_len >= 0]
+        short_counts = np.bincount(with_short_value, minlength=256)
+        for write_type, name in WRITE_TYPES.items():
+            self.counts[name] += int(type_counts[write_type])
+            self.short_value_counts[name] += int(short_counts[write_type])
+        hist, _ = np.histogram(records.short_value_len[records.short_value_len >= 0],
+                               bins=self.SHORT_VALUE_BUCKETS)
+        for i, count in enumerate(hist.tolist()):
+            self.short_value_hist[i] += count
+
+    def to_dict(self) -> dict:
+        return {
+            'total': self.total,
+            'counts': dict(self.counts),
+            'short_value_counts': dict(self.short_value_counts),
+            'short_value_hist': list(self.short_value_hist),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'WriteHistogram':
+        hist = cls()
+        hist.total = d['total']
+        hist.counts.update(d['counts'])
+        hist.short_value_counts.update(d['short_value_counts'])
+        hist.short_value_hist = list(d['short_value_hist'])
+        return hist
+
+    def summary(self) -> str:
+        lines = [f'total {self.total} versions']
+        for name, count in self.counts.items():
+            ratio = count / self.total * 100 if self.total else 0
+            lines.append(f'{name:<10}{count:>14} {ratio:6.2f}%  '
+                         f'short value: {self.short_value_counts[name]}')
+        lines.append('short value length:')
+        for i, count in enumerate(self.short_value_hist):
+            low, high = self.SHORT_VALUE_BUCKETS[i], self.SHORT_VALUE_BUCKETS[i + 1]
+            lines.append(f'  [{low:>3}, {high:>3}) {count:>14}')
+        return '\n'.join(lines)
@@ -0,0 +1,153 @@
+"""bulk load generated rows into a repro table
+
+Rows are spread evenly over the ranges created by
+`split table t between (low) and (high) regions N`, so every region
+gets about the same amount of data::
+
+    load_rows(pool, 't', low=0, high=10000, regions=3, rows=3000000)
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog
+
+
+log = structlog.get_logger()
+
+LoadResult = namedtuple('LoadResult', ['rows', 'elapsed', 'rows_per_second'])
+
+
+def split_ranges(low, high, regions):
+    """the [start, end) ranges of `split table ... between (low) and (high)
+    regions N`, TiDB splits the range evenly
+
+    >>> split_ranges(0, 10000, 3)
+    [(0, 3333), (3333, 6666), (6666, 10000)]
+    """
+    step = (high - low) // regions
+    bounds = [low + step * i for i in range(regions)] + [high]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def region_keys(start, end, count):
+    """pick count distinct int keys evenly from [start, end)
+
+    >>> list(region_keys(0, 10, 3))
+    [0, 3, 6]
+    """
+    count = min(count, end - start)
+    if count <= 0:
+        return range(0)
+    step = (end - start) // count
+    return range(start, start + step * count, step)
+
+
+def _insert_batches(conn, table, columns, keys, batch_size, row_func, progress):
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql_prefix = f'insert into {table} ({", ".join(columns)}) values '
+    batch = []
+    with conn.cursor() as cur:
+        for key in keys:
+            batch.extend(row_func(key))
+            if len(batch) >= batch_size * len(columns):
+                n = len(batch) // len(columns)
+                cur.execute(sql_prefix + ', '.join([placeholder] * n), batch)
+                conn.commit()
+                progress(n)
+                batch = []
+        if batch:
+            n = len(batch) // len(columns)
+            cur.execute(sql_prefix + ', '.join([placeholder] * n), batch)
+            conn.commit()
+            progress(n)
+
+
+def _load_data_infile(conn, table, columns, keys, batch_size, row_func, progress):
+    """stream rows as tsv with LOAD DATA LOCAL INFILE, the connection must be
+    created with local_infile=True. Values must not contain tabs or newlines."""
+    lines = []
+
+    def flush(cur):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False) as f:
+            f.write(''.join(lines))
+        try:
+            cur.execute(f"load data local infile '{f.name}' into table {table} "
+                        f"fields terminated by '\\t' ({', '.join(columns)})")
+            conn.commit()
+        finally:
+            os.unlink(f.name)
+        progress(len(lines))
+        lines.clear()
+
+    with conn.cursor() as cur:
+        for key in keys:
+            lines.append('\t'.join('\\N' if v is None else str(v)
+                                   for v in row_func(key)) + '\n')
+            if len(lines) >= batch_size:
+                flush(cur)
+        if lines:
+            flush(cur)
+
+
+def load_rows(conn_factory, table, low, high, regions, rows, columns=('a',),
+              row_func=None, workers=4, batch_size=1000, load_data=False,
+              report_interval=5):
+    """load rows into table with `workers` connections
+
+    :param conn_factory: a callable returning a connection, e.g. SqlPool.get
+    :param row_func: key -> the values of one row, defaults to (key, )
+    :param load_data: use LOAD DATA LOCAL INFILE instead of batched INSERT
+    :return: LoadResult
+    """
+    row_func = row_func or (lambda key: (key,))
+    ranges = split_ranges(low, high, regions)
+    if rows > high - low:
+        log.warning('rows exceed the key range, only load one row per key',
+                    rows=rows, keys=high - low)
+    per_region = rows // regions
+    # one task per (region, worker slice), so workers write to all regions
+    tasks = []
+    for i, (start, end) in enumerate(ranges):
+        count = per_region + (1 if i < rows % regions else 0)
+        keys = region_keys(start, end, count)
+        slices = max(1, min(workers, len(keys)))
+        tasks.extend(keys[j::slices] for j in range(slices))
+
+    lock = threading.Lock()
+    loaded = 0
+    start_time = time.monotonic()
+    last_report = start_time
+
+    def progress(n):
+        nonlocal loaded, last_report
+        with lock:
+            loaded += n
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                last_report = now
+                log.msg('loading', table=table, rows=loaded,
+                        rows_per_second=round(loaded / (now - start_time)))
+
+    write = _load_data_infile if load_data else _insert_batches
+
+    def run(keys):
+        conn = conn_factory()
+        try:
+            write(conn, table, columns, keys, batch_size, row_func, progress)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(run, keys) for keys in tasks]:
+            future.result()
+
+    elapsed = time.monotonic() - start_time
+    result = LoadResult(loaded, elapsed, loaded / elapsed if elapsed else 0)
+    log.msg('load finished', table=table, rows=result.rows,
+            elapsed=round(elapsed, 3), rows_per_second=round(result.rows_per_second))
+    return result
@@ -0,0 +1,163 @@
+"""timed network fault schedules on top of PlaygroundClient
+
+A schedule is an iterable of Fault. The scheduler runs it in a background
+thread, so the workload keeps running in the foreground, and records
+every fault with a nanosecond wall clock timestamp::
+
+    scheduler = NemesisScheduler(pg)
+    scheduler.start(random_partition(topology.stores(), duration=15, interval=3600))
+    run_workload()
+    scheduler.stop()
+    scheduler.dump_events('faults.jsonl')
+"""
+
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog
+
+
+log = structlog.get_logger()
+
+# wait `delay` seconds, partition `pids` for `duration` seconds, then heal them
+Fault = namedtuple('Fault', ['delay', 'pids', 'duration'])
+# ts_ns is time.time_ns() when the command was sent, latency_ns is how
+# long the playground took to apply it
+FaultEvent = namedtuple('FaultEvent', ['action', 'pid', 'ts_ns', 'latency_ns', 'ok'])
+
+
+def _pids(nodes):
+    # accept pids, PlaygroundInstance or TopologyNode
+    return [getattr(node, 'pid', node) for node in nodes]
+
+
+def partition_set(nodes, duration, delay=0):
+    """partition all nodes at the same time"""
+    yield Fault(delay, _pids(nodes), duration)
+
+
+def rolling_partition(nodes, duration, gap=0, rounds=1):
+    """partition the nodes one by one, `gap` seconds between two faults"""
+    pids = _pids(nodes)
+    for i in range(rounds):
+        for j, pid in enumerate(pids):
+            yield Fault(0 if i == j == 0 else gap, [pid], duration)
+
+
+def random_partition(nodes, duration=15, interval=3600, rounds=None, rng=random):
+    """partition one random node every `interval` seconds, like
+    tidb/hack/random-partition-one-every-hour.yaml"""
+    pids = _pids(nodes)
+    i = 0
+    while rounds is None or i < rounds:
+        # the interval counts from the start of the previous fault
+        yield Fault(interval - duration if i else 0, [rng.choice(pids)], duration)
+        i += 1
+
+
+class NemesisScheduler:
+    def __init__(self, pg, concurrency=8):
+        self._pg = pg
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._running = False  # the schedule thread may still send commands
+        self._stopped = False
+        self._partitioned = set()
+        self.events = []
+
+    def _send(self, action, pid):
+        ts_ns = time.time_ns()
+        start = time.perf_counter_ns()
+        try:
+            ok = getattr(self._pg, action)(pid)
+        except Exception as e:  # noqa
+            log.warning('nemesis command failed', action=action, pid=pid, error=str(e))
+            ok = False
+        event = FaultEvent(action, pid, ts_ns, time.perf_counter_ns() - start, ok)
+        with self._lock:
+            self.events.append(event)
+            if ok and action == 'partition':
+                self._partitioned.add(pid)
+            elif ok:
+                self._partitioned.discard(pid)
+        return event
+
+    def apply(self, action, pids):
+        """send the command for all pids concurrently, return the events"""
+        return list(self._executor.map(lambda pid: self._send(action, pid), pids))
+
+    def partition(self, pids):
+        return self.apply('partition', pids)
+
+    def unpartition(self, pids):
+        return self.apply('unpartition', pids)
+
+    def run(self, schedule):
+        """run the schedule in the current thread till it ends or stop()"""
+        try:
+            for fault in schedule:
+                if self._stop_event.wait(fault.delay):
+                    break
+                log.msg('nemesis partition', pids=fault.pids, duration=fault.duration)
+                self.partition(fault.pids)
+                self._stop_event.wait(fault.duration)
+                self.unpartition(fault.pids)
+                if self._stop_event.is_set():
+                    break
+        finally:
+            self.heal()
+            with self._lock:
+                self._running = False
+                shutdown = self._stopped
+            # stop() timed out waiting for this thread, release the executor here
+            if shutdown:
+                self._executor.shutdown(wait=True)
+
+    def start(self, schedule):
+        self._stop_event.clear()
+        with self._lock:
+            self._running = True
+        self._thread = threading.Thread(target=self.run, args=(schedule,),
+                                        name='nemesis', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """stop the schedule, heal and release the command threads
+
+        The scheduler can not be used after stop. If the schedule thread
+        does not exit within timeout, it heals and shuts the executor down
+        itself when it does.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            self._stopped = True
+            running = self._running
+        if running:
+            log.warning('nemesis thread is still running, it heals on exit')
+            return
+        self._thread = None
+        self.heal()
+        self._executor.shutdown(wait=True)
+
+    def heal(self):
+        """unpartition everything still partitioned"""
+        with self._lock:
+            pids = list(self._partitioned)
+        if pids:
+            self.unpartition(pids)
+
+    def dump_events(self, path):
+        """write events as json lines"""
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event._asdict()) + '\n')
@@ -0,0 +1,250 @@
+"""run many instances of a scenario concurrently
+
+A scenario is a function taking a ScenarioContext. Every instance works
+on its own table (ctx.table), while the PD and playground clients are
+shared by all instances. All instances run on the same stores, so the
+part of a scenario that partitions stores or changes global PD config
+goes in `with ctx.fault_phase():`, which only one instance enters at a
+time. Keep the per-table setup out of it, and wait inside it with
+ctx.wait_until/ctx.wait_all, which have a deadline and give up when the
+runner stops::
+
+    python -m tilo.runner cases.test_7444:scenario_7444 -n 100 -c 8
+"""
+
+import argparse
+import contextlib
+import importlib
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import structlog
+
+from .clients import PdClient, PlaygroundClient, new_sql_conn
+from .sql_pool import SqlPool
+from .topology import PlaygroundTopology
+from .wait import wait_all
+
+
+log = structlog.get_logger()
+
+ScenarioResult = namedtuple('ScenarioResult',
+                            ['index', 'ok', 'elapsed', 'error', 'checkpoints'])
+
+
+class ScenarioStopped(Exception):
+    pass
+
+
+class ScenarioContext:
+    """
+    :param hold: seconds to stay at each checkpoint, ignored in interactive mode
+    :param interactive: block on input() at checkpoints, like the cases used to
+    :param fault_lock: lock shared by the instances which run on the same
+        playground, held during fault_phase
+    """
+
+    def __init__(self, index=0, table='t', pd=None, pg=None, conn_factory=None,
+                 hold=0, interactive=False, stop_event=None, topology=None,
+                 fault_lock=None):
+        self.index = index
+        self.table = table
+        self.pd = pd or PdClient()
+        self.pg = pg or PlaygroundClient()
+        self.topology = topology or PlaygroundTopology(self.pg, self.pd)
+        self.log = log.bind(scenario=index, table=table)
+        self.checkpoints = []  # [(message, monotonic ts), ]
+        self._conn_factory = conn_factory or new_sql_conn
+        self._conn = None
+        self._hold = hold
+        self._interactive = interactive
+        self._stop_event = stop_event or threading.Event()
+        self._fault_lock = fault_lock or threading.Lock()
+        self._partitioned = []  # pids partitioned by this instance
+
+    @property
+    def stop_event(self):
+        return self._stop_event
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self._conn_factory()
+        return self._conn
+
+    def checkpoint(self, message):
+        """mark a point that used to need a manual check"""
+        self.checkpoints.append((message, time.monotonic()))
+        self.log.msg('checkpoint', message=message)
+        if self._interactive:
+            input(f'{message}: ')
+        elif self._hold:
+            # return early when the runner is stopping
+            self._stop_event.wait(self._hold)
+
+    def wait_all(self, conds, timeout, backoff=None):
+        """tilo.wait.wait_all, which gives up when the runner is stopping
+
+        :param conds: a callable or a dict of named callables
+        :raises ScenarioStopped: when the stop event is set
+        """
+        if callable(conds):
+            conds = {getattr(conds, '__name__', 'cond'): conds}
+
+        def checked(cond):
+            def call():
+                if self._stop_event.is_set():
+                    raise ScenarioStopped('the runner is stopping')
+                return cond()
+            return call
+
+        return wait_all({name: checked(cond) for name, cond in conds.items()},
+                        timeout=timeout, backoff=backoff)
+
+    def wait_until(self, cond, timeout, backoff=None):
+        return self.wait_all({'cond': cond}, timeout, backoff)[0]
+
+    @contextlib.contextmanager
+    def fault_phase(self):
+        """run the fault injection part of a scenario exclusively
+
+        The partitions applied inside the phase are healed when it exits.
+        """
+        with self._fault_lock:
+            try:
+                yield
+            finally:
+                self.heal()
+
+    def partition(self, pid):
+        ok = self.pg.partition(pid)
+        if ok and pid not in self._partitioned:
+            self._partitioned.append(pid)
+        return ok
+
+    def unpartition(self, pid):
+        ok = self.pg.unpartition(pid)
+        if ok and pid in self._partitioned:
+            self._partitioned.remove(pid)
+        return ok
+
+    def heal(self):
+        """unpartition every store this instance partitioned"""
+        for pid in list(self._partitioned):
+            self.log.msg('heal partition', pid=pid)
+            if not self.unpartition(pid):
+                self.log.error('heal partition failed', pid=pid)
+                self._partitioned.remove(pid)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def run_interactive(scenario, **kwargs):
+    """run one scenario on table t, block at checkpoints"""
+    ctx = ScenarioContext(interactive=True, **kwargs)
+    try:
+        scenario(ctx)
+    finally:
+        ctx.heal()
+        ctx.close()
+
+
+def run_scenarios(scenario, count, concurrency=4, pd=None, pg=None,
+                  conn_factory=None, table_prefix='t_tilo_', hold=0):
+    """run `count` instances of scenario with at most `concurrency` at a time
+
+    The instance i works on table {table_prefix}{i}. A failed instance
+    does not stop the others, its error is recorded in the result.
+    Pass SqlPool.get as conn_factory to share pooled connections.
+    The fault phases of the instances never overlap.
+    """
+    pd = pd or PdClient(pool_size=concurrency)
+    pg = pg or PlaygroundClient(pool_size=concurrency)
+    topology = PlaygroundTopology(pg, pd)
+    stop_event = threading.Event()
+    fault_lock = threading.Lock()
+
+    def run_one(index):
+        ctx = ScenarioContext(index, f'{table_prefix}{index}', pd=pd, pg=pg,
+                              conn_factory=conn_factory, hold=hold,
+                              stop_event=stop_event, topology=topology,
+                              fault_lock=fault_lock)
+        start = time.monotonic()
+        error = None
+        try:
+            scenario(ctx)
+        except Exception:  # noqa
+            error = traceback.format_exc()
+            ctx.log.error('scenario failed', error=error)
+        finally:
+            try:
+                ctx.heal()
+            except Exception:  # noqa
+                ctx.log.error('heal failed', error=traceback.format_exc())
+            ctx.close()
+        return ScenarioResult(index, error is None, time.monotonic() - start,
+                              error, ctx.checkpoints)
+
+    results = []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_one, i) for i in range(count)]
+        try:
+            for future in as_completed(futures):
+                results.append(future.result())
+        except KeyboardInterrupt:
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+            raise
+    elapsed = time.monotonic() - start
+    failed = sum(1 for r in results if not r.ok)
+    log.msg('scenarios finished', count=count, failed=failed,
+            elapsed=round(elapsed, 3),
+            per_hour=round(count / elapsed * 3600) if elapsed else None)
+    return sorted(results, key=lambda r: r.index)
+
+
+def load_scenario(path):
+    """load a scenario from 'module:function'"""
+    module_name, func_name = path.split(':', 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run tilo scenarios concurrently')
+    parser.add_argument('scenario', help='module:function, e.g. cases.test_7444:scenario_7444')
+    parser.add_argument('-n', '--count', type=int, default=1)
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('--pd', default='http://127.0.0.1:2379')
+    parser.add_argument('--playground', default='http://127.0.0.1:9527')
+    parser.add_argument('--db', default='mysql://root@127.0.0.1:4000',
+                        help='comma separated TiDB uris, connections are pooled across them')
+    parser.add_argument('--hold', type=float, default=0,
+                        help='seconds to stay at each checkpoint')
+    args = parser.parse_args()
+
+    sql_pool = SqlPool(args.db, size=args.concurrency)
+    try:
+        results = run_scenarios(load_scenario(args.scenario), args.count,
+                                concurrency=args.concurrency,
+                                pd=PdClient(args.pd, pool_size=args.concurrency),
+                                pg=PlaygroundClient(args.playground, pool_size=args.concurrency),
+                                conn_factory=sql_pool.get,
+                                hold=args.hold)
+    finally:
+        sql_pool.close()
+    for result in results:
+        if not result.ok:
+            print(f'scenario {result.index} failed:\n{result.error}')
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+import structlog
+
+from .clients import connect_sql, parse_db_uris
+
+
+log = structlog.get_logger()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class NoHealthyEndpoint(Exception):
+    pass
+
+
+class PoolClosed(Exception):
+    pass
+
+
+class _Endpoint:
+    def __init__(self, uri):
+        self.uri = uri
+        self.down_until = 0
+        self.active = 0  # connections opened to the endpoint and not closed
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+
+class PooledConnection:
+    """a pymysql connection borrowed from SqlPool
+
+    close() returns the connection to the pool instead of closing it,
+    so code written for new_sql_conn works with pooled connections.
+    """
+
+    def __init__(self, pool, conn, endpoint):
+        self._pool = pool
+        self._conn = conn
+        self._endpoint = endpoint
+        self._released = False
+        self.broken = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if isinstance(exc_value, pymysql.OperationalError):
+            self.broken = True
+        self.close()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._release(self)
+
+
+class SqlPool:
+    """a thread safe pool of pymysql connections over several TiDB endpoints
+
+    New connections go to the healthy endpoint with the fewest open
+    connections. An endpoint which fails to connect is skipped for
+    `down_seconds`. An idle connection is pinged before it is handed out
+    if it has been idle for more than `check_idle_seconds`, a dead one is
+    dropped and replaced.
+
+    :param db_uri: comma separated uris or a list of uris
+    :param size: max connections, idle and borrowed
+    """
+
+    def __init__(self, db_uri='mysql://root@127.0.0.1:4000', size=8,
+                 check_idle_seconds=5, down_seconds=10, connect=connect_sql,
+                 **connect_kwargs):
+        self._endpoints = [_Endpoint(uri) for uri in parse_db_uris(db_uri)]
+        if not self._endpoints:
+            raise ValueError('no db uri')
+        self._size = size
+        self._check_idle_seconds = check_idle_seconds
+        self._down_seconds = down_seconds
+        self._connect = connect
+        self._connect_kwargs = connect_kwargs
+        self._idle = []  # [(conn, endpoint, released_at), ]
+        self._total = 0
+        self._cond = threading.Condition()
+        self._rr = itertools.count()
+        self._closed = False
+        self.stats = {'opened': 0, 'reused': 0, 'recycled': 0, 'connect_errors': 0}
+
+    def get(self, timeout=None) -> PooledConnection:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolClosed('the pool is closed')
+                if self._idle:
+                    conn, endpoint, released_at = self._idle.pop()
+                    break
+                if self._total < self._size:
+                    self._total += 1
+                    conn = endpoint = None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(f'no connection available in {timeout}s')
+                self._cond.wait(remaining)
+
+        if conn is not None:
+            if time.monotonic() - released_at < self._check_idle_seconds or self._ping(conn):
+                self._count('reused')
+                return PooledConnection(self, conn, endpoint)
+            self._discard(conn, endpoint, keep_slot=True)
+
+        try:
+            conn, endpoint = self._open()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn, endpoint)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.get(timeout)
+        with conn:
+            yield conn
+
+    def _ping(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except pymysql.Error:
+            return False
+
+    def _pick_endpoints(self):
+        now = time.monotonic()
+        with self._cond:
+            return self._order_endpoints(now)
+
+    def _order_endpoints(self, now):
+        healthy = [e for e in self._endpoints if e.healthy(now)]
+        if not healthy:
+            # all endpoints are down, try them all anyway
+            healthy = list(self._endpoints)
+        # round robin among the least loaded ones
+        least = min(e.active for e in healthy)
+        candidates = [e for e in healthy if e.active == least]
+        start = next(self._rr) % len(candidates)
+        ordered = candidates[start:] + candidates[:start]
+        return ordered + [e for e in healthy if e not in ordered]
+
+    def _open(self):
+        errors = []
+        for endpoint in self._pick_endpoints():
+            try:
+                conn = self._connect(endpoint.uri, **self._connect_kwargs)
+            except pymysql.Error as e:
+                self._count('connect_errors')
+                endpoint.down_until = time.monotonic() + self._down_seconds
+                log.warning('connect failed, mark endpoint down', uri=endpoint.uri, error=str(e))
+                errors.append(e)
+                continue
+            with self._cond:
+                endpoint.active += 1
+                self.stats['opened'] += 1
+            return conn, endpoint
+        raise NoHealthyEndpoint(f'all endpoints failed: {errors}')
+
+    def _discard(self, conn, endpoint, keep_slot=False):
+        """close a connection, keep_slot means the caller reopens one"""
+        self._count('recycled')
+        with self._cond:
+            endpoint.active -= 1
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+        if not keep_slot:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+
+    def _count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+
+    def _release(self, pooled):
+        conn, endpoint = pooled._conn, pooled._endpoint
+        if pooled.broken or not conn.open or self._closed:
+            self._discard(conn, endpoint)
+            return
+        # do not hand an open transaction to the next borrower
+        try:
+            conn.rollback()
+        except pymysql.Error as e:
+            log.warning('rollback failed, discard connection', uri=endpoint.uri, error=str(e))
+            self._discard(conn, endpoint)
+            return
+        with self._cond:
+            self._idle.append((conn, endpoint, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        """close the idle connections, borrowed ones are closed on release"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, endpoint, _ in idle:
+            self._discard(conn, endpoint)
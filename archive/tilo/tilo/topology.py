@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import namedtuple
+
+import structlog
+
+
+log = structlog.get_logger()
+
+TopologyNode = namedtuple('TopologyNode', ['pid', 'role', 'port', 'store_id'])
+
+
+def store_playground_port(address):
+    """map a store address to the port of its playground instance
+
+    The store advertises the proxy port, for example 30160, while the
+    playground instance listens on 20160.
+
+    >>> store_playground_port('127.0.0.1:30160')
+    '20160'
+    """
+    port = address.rsplit(':', 1)[1]
+    # HACK: we convert 30160 to 20160
+    return '2' + port[1:]
+
+
+# the indexes are replaced as a whole, never updated in place
+_Indexes = namedtuple('_Indexes', ['by_pid', 'by_port', 'by_store_id'])
+
+
+class PlaygroundTopology:
+    """indexed view of playground instances and PD stores
+
+    Lookups by pid, port and store id are dict lookups. The topology is
+    fetched on the first lookup and refreshed when older than `ttl`
+    seconds (never if ttl is None) or when a lookup misses, at most once
+    per `miss_refresh_interval` seconds.
+    """
+
+    def __init__(self, pg, pd, ttl=None, clock=time.monotonic, miss_refresh_interval=1):
+        self._pg = pg
+        self._pd = pd
+        self._ttl = ttl
+        self._clock = clock
+        self._miss_refresh_interval = miss_refresh_interval
+        self._refreshed_at = None
+        # scenarios running in threads share one topology
+        self._lock = threading.RLock()
+        self._indexes = _Indexes({}, {}, {})
+
+    def refresh(self):
+        """refetch instances and stores, only changed nodes are replaced"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        store_ids = {}  # {playground port: store id}
+        for store in self._pd.list_stores():
+            store_meta = store['store']
+            store_ids[store_playground_port(store_meta['address'])] = store_meta['id']
+
+        # build the new indexes aside, readers keep using the old ones
+        old = self._indexes
+        indexes = _Indexes({}, {}, {})
+        for inst in self._pg.list_instances():
+            port = str(inst.port)
+            node = TopologyNode(inst.pid, inst.role, port, store_ids.get(port))
+            old_node = old.by_pid.get(node.pid)
+            if old_node == node:
+                node = old_node
+            else:
+                log.debug('topology node updated', **node._asdict())
+            indexes.by_pid[node.pid] = node
+            indexes.by_port[node.port] = node
+            if node.store_id is not None:
+                indexes.by_store_id[node.store_id] = node
+        for pid in old.by_pid:
+            if pid not in indexes.by_pid:
+                log.debug('topology node removed', pid=pid)
+        self._indexes = indexes
+        self._refreshed_at = self._clock()
+
+    def _fresh_indexes(self):
+        with self._lock:
+            if self._refreshed_at is None or (
+                    self._ttl is not None and self._clock() - self._refreshed_at >= self._ttl):
+                self._refresh()
+            return self._indexes
+
+    def _lookup(self, index, key):
+        node = getattr(self._fresh_indexes(), index).get(key)
+        if node is None:
+            # a miss may be a new instance, refresh unless it was done just now
+            with self._lock:
+                if self._clock() - self._refreshed_at >= self._miss_refresh_interval:
+                    self._refresh()
+                node = getattr(self._indexes, index).get(key)
+        return node
+
+    def by_pid(self, pid):
+        return self._lookup('by_pid', str(pid))
+
+    def by_port(self, port):
+        return self._lookup('by_port', str(port))
+
+    def by_store(self, store_id):
+        return self._lookup('by_store_id', store_id)
+
+    def store_pid(self, store_id):
+        """the playground pid of a store, for partition/unpartition"""
+        node = self.by_store(store_id)
+        return None if node is None else node.pid
+
+    def stores(self):
+        """list the nodes of tikv stores, ordered by store id"""
+        by_store_id = self._fresh_indexes().by_store_id
+        return [by_store_id[store_id] for store_id in sorted(by_store_id)]
+
+    def nodes(self, role=None):
+        by_pid = self._fresh_indexes().by_pid
+        return [node for node in by_pid.values() if role is None or node.role == role]
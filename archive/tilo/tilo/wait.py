@@ -0,0 +1,154 @@
+"""wait till conditions become true, with deadline and backoff
+
+Conditions are callables returning True when the wait is over. The
+async variants also accept coroutine functions::
+
+    wait_all({
+        'left': lambda: pd.get_region(left)['leader']['store_id'] == s1,
+        'right': lambda: pd.get_region(right)['leader']['store_id'] == s1,
+    }, timeout=30)
+"""
+
+import asyncio
+import inspect
+import time
+from collections import namedtuple
+
+import structlog
+
+
+log = structlog.get_logger()
+
+WaitStats = namedtuple('WaitStats', ['name', 'ok', 'attempts', 'elapsed'])
+
+
+class WaitTimeout(Exception):
+    def __init__(self, stats):
+        pending = [s.name for s in stats if not s.ok]
+        super().__init__(f'wait timeout, pending conditions: {pending}')
+        self.stats = stats
+
+
+class Backoff:
+    """exponential backoff, interval grows from `initial` by `factor`
+    till `max_interval`. factor=1 means a fixed interval.
+
+    >>> b = Backoff(0.1, factor=2, max_interval=0.3)
+    >>> [b.next() for _ in range(4)]
+    [0.1, 0.2, 0.3, 0.3]
+    """
+
+    def __init__(self, initial=0.1, factor=2, max_interval=2):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max(initial, max_interval)
+        self._interval = initial
+
+    def next(self):
+        interval = self._interval
+        self._interval = min(self._interval * self.factor, self.max_interval)
+        return interval
+
+    def reset(self):
+        self._interval = self.initial
+
+
+def _as_named(conds):
+    if callable(conds):
+        return {getattr(conds, '__name__', 'cond'): conds}
+    if isinstance(conds, dict):
+        return dict(conds)
+    return {f'cond-{i}': cond for i, cond in enumerate(conds)}
+
+
+class _Waiter:
+    """bookkeeping of pending conditions, shared by the sync and async loops"""
+
+    def __init__(self, conds, timeout, backoff):
+        self.conds = _as_named(conds)
+        self.backoff = backoff or Backoff()
+        self.start = time.monotonic()
+        self.deadline = None if timeout is None else self.start + timeout
+        self.attempts = {name: 0 for name in self.conds}
+        self.done = {}  # {name: WaitStats}
+
+    def pending(self):
+        return [(name, cond) for name, cond in self.conds.items() if name not in self.done]
+
+    def record(self, name, ok):
+        self.attempts[name] += 1
+        if ok is True:
+            self.done[name] = WaitStats(name, True, self.attempts[name],
+                                        time.monotonic() - self.start)
+
+    def next_sleep(self):
+        """return seconds to sleep before the next round, raise WaitTimeout
+        if the deadline is reached"""
+        interval = self.backoff.next()
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise WaitTimeout(self.stats())
+            interval = min(interval, remaining)
+        return interval
+
+    def stats(self):
+        elapsed = time.monotonic() - self.start
+        return [self.done.get(name) or WaitStats(name, False, self.attempts[name], elapsed)
+                for name in self.conds]
+
+    def finish(self):
+        stats = self.stats()
+        log.msg('wait finished', elapsed=round(time.monotonic() - self.start, 3),
+                attempts=sum(s.attempts for s in stats))
+        return stats
+
+
+def wait_all(conds, timeout=None, backoff=None):
+    """wait till all conditions are true
+
+    :param conds: a callable, a list of callables or a dict of named callables
+    :param timeout: seconds, None means wait forever
+    :param backoff: a Backoff, polling interval of each round
+    :return: a list of WaitStats
+    :raises WaitTimeout: when some conditions are still false at the deadline
+    """
+    waiter = _Waiter(conds, timeout, backoff)
+    while True:
+        for name, cond in waiter.pending():
+            waiter.record(name, cond())
+        if not waiter.pending():
+            return waiter.finish()
+        time.sleep(waiter.next_sleep())
+
+
+def wait_until(cond, timeout=None, backoff=None):
+    """wait till one condition is true, return its WaitStats"""
+    return wait_all({'cond': cond}, timeout=timeout, backoff=backoff)[0]
+
+
+async def _call(cond):
+    result = cond()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def async_wait_all(conds, timeout=None, backoff=None):
+    """asyncio version of wait_all, pending conditions of one round
+    are evaluated concurrently"""
+    waiter = _Waiter(conds, timeout, backoff)
+    while True:
+        pending = waiter.pending()
+        results = await asyncio.gather(*[_call(cond) for _, cond in pending])
+        for (name, _), ok in zip(pending, results):
+            waiter.record(name, ok)
+        if not waiter.pending():
+            return waiter.finish()
+        await asyncio.sleep(waiter.next_sleep())
+
+
+async def async_wait_until(cond, timeout=None, backoff=None):
+    """asyncio version of wait_until"""
+    stats = await async_wait_all({'cond': cond}, timeout=timeout, backoff=backoff)
+    return stats[0]
@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
+import csv
+import importlib.util
+import json
+import math
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Iterable, List, Optional, Sequence
+from typing import Any, Dict, Iterable, List, Optional, Sequence
 
 import click
 import pymysql
+import pymysql.cursors
+from pymysql.constants import FIELD_TYPE
 
 
 DEFAULT_MYSQL_PORT = 9030
+DEFAULT_FETCH_SIZE = 10000
+OUTPUT_FORMATS = ["tsv", "csv", "jsonl", "parquet"]
 
 
 def load_env_file(env_path: Path) -> None:
@@ -69,6 +80,373 @@ def print_rows(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
         click.echo("\t".join(formatted))
 
 
+class RowWriter:
+    """Write one result set batch by batch; subclasses handle the format."""
+
+    def __init__(self, stream, owns_stream: bool = False) -> None:
+        self.stream = stream
+        self.owns_stream = owns_stream
+        self.rows = 0
+
+    def begin(self, columns: Sequence[str], description: Optional[Sequence[tuple]] = None) -> None:
+        self.columns = list(columns)
+        self.description = description
+
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self.owns_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class TsvWriter(RowWriter):
+    """Same text as print_rows, written a batch at a time."""
+
+    def begin(self, columns: Sequence[str], description: Optional[Sequence[tuple]] = None) -> None:
+        super().begin(columns, description)
+        self.stream.write("\t".join(columns) + "\n")
+
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        super().write(rows)
+        self.stream.write("".join(
+            "\t".join(["NULL" if value is None else str(value) for value in row]) + "\n"
+            for row in rows
+        ))
+
+
+class CsvWriter(RowWriter):
+    def begin(self, columns: Sequence[str], description: Optional[Sequence[tuple]] = None) -> None:
+        super().begin(columns, description)
+        self._writer = csv.writer(self.stream)
+        self._writer.writerow(columns)
+
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        super().write(rows)
+        self._writer.writerows(rows)
+
+
+class JsonLinesWriter(RowWriter):
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        super().write(rows)
+        self.stream.write("".join(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        ))
+
+
+_INT_FIELD_TYPES = {
+    FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.INT24, FIELD_TYPE.LONG,
+    FIELD_TYPE.LONGLONG, FIELD_TYPE.YEAR,
+}
+_DECIMAL_FIELD_TYPES = {FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+
+
+class ParquetWriter(RowWriter):
+    """One row group per fetched batch, the schema comes from the first batch.
+
+    An empty result still writes a file, typed from cursor.description.
+    Requires pyarrow (`uv run --extra parquet ...`).
+    """
+
+    def __init__(self, path: Path) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self._path = path
+        self._writer = None
+        self._schema = None
+        self.columns: List[str] = []
+        self.description = None
+        self.rows = 0
+
+    def _decimal_type(self, column: tuple):
+        precision, scale = column[4], column[5]
+        return self._pa.decimal128(min(max(precision or 38, 1), 38), scale or 0)
+
+    def _description_type(self, column: tuple):
+        """The arrow type value inference gives for a column, from its type code."""
+        pa = self._pa
+        type_code = column[1]
+        if type_code in _INT_FIELD_TYPES:
+            return pa.int64()
+        if type_code in (FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE):
+            return pa.float64()
+        if type_code in _DECIMAL_FIELD_TYPES:
+            return self._decimal_type(column)
+        if type_code == FIELD_TYPE.DATE:
+            return pa.date32()
+        if type_code in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+            return pa.timestamp("us")
+        return pa.string()
+
+    def write(self, rows: Sequence[Sequence[Any]]) -> None:
+        if not rows:
+            return
+        self.rows += len(rows)
+        pa = self._pa
+        columns = list(zip(*rows))
+        if self._schema is None:
+            fields = []
+            for i, (name, values) in enumerate(zip(self.columns, columns)):
+                field_type = pa.array(values).type
+                if pa.types.is_null(field_type):
+                    # an all NULL first batch says nothing about the type
+                    field_type = pa.string()
+                elif pa.types.is_decimal(field_type) and self.description:
+                    # the first values may be narrower than the column
+                    field_type = self._decimal_type(self.description[i])
+                fields.append(pa.field(name, field_type))
+            self._schema = pa.schema(fields)
+            self._writer = self._pq.ParquetWriter(str(self._path), self._schema)
+        arrays = []
+        for field, values in zip(self._schema, columns):
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        if self._writer is None and self.description:
+            # no rows, still leave a file with the columns of the result
+            self._schema = self._pa.schema([
+                self._pa.field(name, self._description_type(column))
+                for name, column in zip(self.columns, self.description)
+            ])
+            self._writer = self._pq.ParquetWriter(str(self._path), self._schema)
+        if self._writer is not None:
+            self._writer.close()
+
+
+def output_path(output: Path, index: int, total: int) -> Path:
+    """The file for the index-th statement, numbered when several statements run."""
+    if total <= 1:
+        return output
+    return output.with_name(f"{output.stem}.{index}{output.suffix}")
+
+
+def open_writer(fmt: str, path: Optional[Path]) -> RowWriter:
+    if fmt == "parquet":
+        return ParquetWriter(path)
+    writer_cls = {"tsv": TsvWriter, "csv": CsvWriter, "jsonl": JsonLinesWriter}[fmt]
+    if path is None:
+        return writer_cls(click.get_text_stream("stdout"))
+    stream = open(path, "w", encoding="utf-8", newline="" if fmt == "csv" else None)
+    return writer_cls(stream, owns_stream=True)
+
+
+def fetch_batches(cursor, stream: bool, fetch_size: int) -> Iterable[Sequence[Sequence[Any]]]:
+    """All rows at once, or fetchmany chunks from an unbuffered cursor."""
+    if not stream:
+        yield cursor.fetchall()
+        return
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
+
+class LatencyHistogram:
+    """HDR style latency histogram in microseconds.
+
+    Each power of two range is split into SUB_BUCKETS linear buckets, so a
+    recorded value is off by at most 1/SUB_BUCKETS of itself while memory
+    stays constant however many samples are recorded.
+    """
+
+    SUB_BUCKETS = 16
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def bucket_of(cls, value_us: int) -> int:
+        if value_us < cls.SUB_BUCKETS:
+            return value_us
+        shift = value_us.bit_length() - cls.SUB_BUCKETS.bit_length()
+        return (shift + 1) * cls.SUB_BUCKETS + (value_us >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_upper(cls, bucket: int) -> int:
+        """Largest value in microseconds that falls into the bucket."""
+        if bucket < cls.SUB_BUCKETS:
+            return bucket
+        shift = bucket // cls.SUB_BUCKETS - 1
+        sub = bucket % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_us: int) -> None:
+        bucket = self.bucket_of(value_us)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct: float) -> int:
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.bucket_upper(bucket), self.max_us)
+        return self.max_us
+
+    def buckets(self) -> List[tuple]:
+        """[(upper bound us, count, cumulative fraction)] of non empty buckets."""
+        result = []
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            result.append((self.bucket_upper(bucket), self.counts[bucket], seen / self.count))
+        return result
+
+
+class StatementStats:
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.first_error: Optional[str] = None
+
+    def merge(self, other: "StatementStats") -> None:
+        self.latency.merge(other.latency)
+        self.errors += other.errors
+        if self.first_error is None:
+            self.first_error = other.first_error
+
+
+def run_benchmark(
+    conn_kwargs: Dict[str, Any],
+    statements: Sequence[str],
+    concurrency: int,
+    duration: Optional[float],
+    iterations: int,
+) -> tuple:
+    """Replay the statements in order on `concurrency` connections.
+
+    Every connection runs `iterations` passes over the statements, or
+    keeps looping until `duration` seconds have passed. Each worker records
+    into its own stats, which are merged at the end, so the hot path takes
+    no locks. Returns (per statement stats, elapsed seconds).
+    """
+    stop_event = threading.Event()
+    # connect up front, so a bad address fails fast and connecting is not timed
+    conns = []
+    try:
+        for _ in range(concurrency):
+            conns.append(pymysql.connect(**conn_kwargs))
+    except pymysql.MySQLError:
+        for conn in conns:
+            conn.close()
+        raise
+
+    def worker(conn) -> List[StatementStats]:
+        stats = [StatementStats() for _ in statements]
+        try:
+            with conn.cursor() as cursor:
+                passes = 0
+                while not stop_event.is_set() and (duration is not None or passes < iterations):
+                    for stmt, stmt_stats in zip(statements, stats):
+                        if stop_event.is_set():
+                            break
+                        start = time.perf_counter_ns()
+                        try:
+                            cursor.execute(stmt)
+                            if cursor.description:
+                                cursor.fetchall()
+                        except pymysql.MySQLError as exc:
+                            stmt_stats.errors += 1
+                            if stmt_stats.first_error is None:
+                                stmt_stats.first_error = str(exc)
+                            continue
+                        stmt_stats.latency.record((time.perf_counter_ns() - start) // 1000)
+                    passes += 1
+        finally:
+            conn.close()
+        return stats
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker, conn) for conn in conns]
+        try:
+            if duration is not None and not stop_event.wait(duration):
+                stop_event.set()
+            worker_stats = [future.result() for future in futures]
+        except KeyboardInterrupt:
+            stop_event.set()
+            worker_stats = [future.result() for future in futures]
+    elapsed = time.monotonic() - start
+
+    merged = [StatementStats() for _ in statements]
+    for stats in worker_stats:
+        for total, part in zip(merged, stats):
+            total.merge(part)
+    return merged, elapsed
+
+
+def benchmark_report(statements: Sequence[str], stats: Sequence[StatementStats], elapsed: float) -> dict:
+    report = {"elapsed_seconds": round(elapsed, 3), "statements": []}
+    for stmt, stmt_stats in zip(statements, stats):
+        latency = stmt_stats.latency
+        report["statements"].append({
+            "sql": stmt,
+            "count": latency.count,
+            "errors": stmt_stats.errors,
+            "first_error": stmt_stats.first_error,
+            "qps": round(latency.count / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(latency.total_us / latency.count / 1000, 3) if latency.count else 0,
+            "p50_ms": latency.percentile(50) / 1000,
+            "p95_ms": latency.percentile(95) / 1000,
+            "p99_ms": latency.percentile(99) / 1000,
+            "max_ms": latency.max_us / 1000,
+            "buckets": [
+                {"le_ms": upper / 1000, "count": count, "cumulative": round(cum, 4)}
+                for upper, count, cum in latency.buckets()
+            ],
+        })
+    return report
+
+
+def print_benchmark_report(report: dict, with_buckets: bool) -> None:
+    click.echo(f"Elapsed: {report['elapsed_seconds']}s")
+    click.echo("stmt\tcount\terrors\tqps\tmean_ms\tp50_ms\tp95_ms\tp99_ms\tmax_ms\tsql")
+    for i, item in enumerate(report["statements"], 1):
+        sql = " ".join(item["sql"].split())
+        click.echo(
+            "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
+                i, item["count"], item["errors"], item["qps"], item["mean_ms"],
+                item["p50_ms"], item["p95_ms"], item["p99_ms"], item["max_ms"],
+                sql if len(sql) <= 60 else sql[:57] + "...",
+            )
+        )
+    for i, item in enumerate(report["statements"], 1):
+        if item["first_error"]:
+            click.echo(f"stmt {i} first error: {item['first_error']}", err=True)
+        if with_buckets and item["buckets"]:
+            click.echo(f"stmt {i} latency buckets:")
+            click.echo("  le_ms\tcount\tcumulative")
+            for bucket in item["buckets"]:
+                click.echo(
+                    "  {}\t{}\t{:.2%}".format(bucket["le_ms"], bucket["count"], bucket["cumulative"])
+                )
+
+
 @click.command(help="Run SQL against Doris FE via MySQL protocol")
 @click.option(
     "--env-file",
@@ -100,6 +478,62 @@ def print_rows(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> None:
     show_default=True,
     help="Timeout seconds for MySQL",
 )
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Fetch rows with an unbuffered server side cursor in --fetch-size chunks, constant memory",
+)
+@click.option(
+    "--fetch-size",
+    type=click.IntRange(1, None),
+    default=DEFAULT_FETCH_SIZE,
+    show_default=True,
+    help="Rows per fetchmany in --stream mode",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="tsv",
+    show_default=True,
+    help="Result output format",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write results to this file instead of stdout; numbered per statement (out.N.ext) when several statements run",
+)
+@click.option(
+    "--bench",
+    is_flag=True,
+    help="Benchmark mode: replay the statements concurrently and report latency instead of rows",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(1, None),
+    default=8,
+    show_default=True,
+    help="Benchmark connections, each replays all statements in order",
+)
+@click.option(
+    "--duration",
+    type=click.FloatRange(0, None, min_open=True),
+    help="Benchmark for N seconds, overrides --iterations",
+)
+@click.option(
+    "--iterations",
+    type=click.IntRange(1, None),
+    default=1,
+    show_default=True,
+    help="Passes over the statements per connection",
+)
+@click.option(
+    "--report",
+    type=click.Choice(["buckets", "json", "summary"]),
+    default="buckets",
+    show_default=True,
+    help="Benchmark report format",
+)
 def main(
     env_file: Path,
     host: Optional[str],
@@ -110,6 +544,15 @@ def main(
     sql_items: Sequence[str],
     sql_file: Optional[Path],
     timeout: int,
+    stream: bool,
+    fetch_size: int,
+    output_format: str,
+    output: Optional[Path],
+    bench: bool,
+    concurrency: int,
+    duration: Optional[float],
+    iterations: int,
+    report: str,
 ) -> int:
     load_env_file(env_file)
 
@@ -118,31 +561,58 @@ def main(
         click.echo("No SQL provided. Use --sql and/or --sql-file.", err=True)
         return 2
 
+    if output_format == "parquet":
+        if output is None:
+            click.echo("--format parquet needs --output.", err=True)
+            return 2
+        if importlib.util.find_spec("pyarrow") is None:
+            click.echo("pyarrow is required for --format parquet, please install it first.", err=True)
+            return 2
+
     resolved_host = resolve_value(host, "DORIS_HOST", required=True)
     resolved_port = resolve_port(port, "DORIS_PORT", DEFAULT_MYSQL_PORT)
     resolved_user = resolve_value(user, "DORIS_USER", default="root")
     resolved_password = resolve_value(password, "DORIS_PASSWORD")
     resolved_database = resolve_value(database, "DORIS_DATABASE")
 
+    conn_kwargs = dict(
+        host=resolved_host,
+        port=resolved_port,
+        user=resolved_user,
+        password=resolved_password,
+        database=resolved_database or None,
+        connect_timeout=timeout,
+        read_timeout=timeout,
+        write_timeout=timeout,
+        autocommit=True,
+    )
+
+    if bench:
+        try:
+            stats, elapsed = run_benchmark(conn_kwargs, statements, concurrency, duration, iterations)
+        except pymysql.MySQLError as exc:
+            click.echo(f"Failed to connect to MySQL: {exc}", err=True)
+            return 2
+        result = benchmark_report(statements, stats, elapsed)
+        if report == "json":
+            click.echo(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print_benchmark_report(result, with_buckets=report == "buckets")
+        return 1 if any(item["errors"] for item in result["statements"]) else 0
+
     try:
-        conn = pymysql.connect(
-            host=resolved_host,
-            port=resolved_port,
-            user=resolved_user,
-            password=resolved_password,
-            database=resolved_database or None,
-            connect_timeout=timeout,
-            read_timeout=timeout,
-            write_timeout=timeout,
-            autocommit=True,
-        )
+        conn = pymysql.connect(**conn_kwargs)
     except pymysql.MySQLError as exc:
         click.echo(f"Failed to connect to MySQL: {exc}", err=True)
         return 2
 
+    # which statements return rows is only known after running them, so
+    # output files are numbered whenever more than one statement runs
+    total_outputs = len(statements)
+    cursor_class = pymysql.cursors.SSCursor if stream else pymysql.cursors.Cursor
     try:
-        with conn.cursor() as cursor:
-            for stmt in statements:
+        with conn.cursor(cursor_class) as cursor:
+            for index, stmt in enumerate(statements, 1):
                 try:
                     cursor.execute(stmt)
                 except pymysql.MySQLError as exc:
@@ -151,8 +621,22 @@ def main(
 
                 if cursor.description:
                     columns = [col[0] for col in cursor.description]
-                    rows = cursor.fetchall()
-                    print_rows(columns, rows)
+                    if output is None and output_format == "tsv" and not stream:
+                        print_rows(columns, cursor.fetchall())
+                        continue
+                    path = output_path(output, index, total_outputs) if output else None
+                    writer = open_writer(output_format, path)
+                    try:
+                        writer.begin(columns, cursor.description)
+                        for rows in fetch_batches(cursor, stream, fetch_size):
+                            writer.write(rows)
+                    except pymysql.MySQLError as exc:
+                        click.echo(f"SQL failed: {exc}", err=True)
+                        return 1
+                    finally:
+                        writer.close()
+                    if path is not None:
+                        click.echo(f"OK ({writer.rows} rows written to {path})")
                 else:
                     rowcount = cursor.rowcount
                     click.echo(f"OK ({rowcount} rows affected)")
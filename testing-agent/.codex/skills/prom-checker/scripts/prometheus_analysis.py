@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Vectorized jitter and anomaly analysis of Prometheus matrix results.
+
+The matrix is converted once into a (series, steps) float64 array aligned
+on the union of sample timestamps; missing and non-finite samples are NaN.
+All statistics are then computed on that array without per-sample loops.
+
+Requires numpy (`uv run --extra analysis ...`), except RollingStats which
+is plain Python and updates in O(1) per sample for watch mode.
+"""
+import math
+import warnings
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_TOP_K = 5
+DEFAULT_ROLLING_WINDOW = 10
+DEFAULT_Z_THRESHOLD = 3.0
+
+
+class MatrixArrays(NamedTuple):
+    labels: List[str]
+    ts: "np.ndarray"  # (steps,)
+    values: "np.ndarray"  # (series, steps), NaN where missing
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required, please install it first")
+
+
+def matrix_to_arrays(series: List[dict], label: str = "instance") -> MatrixArrays:
+    """Convert the `result` list of a matrix response into aligned arrays.
+
+    Items may also be SeriesArrays from prometheus_stream.
+    """
+    _require_numpy()
+    ts_cols = []
+    val_cols = []
+    for item in series:
+        if hasattr(item, "ts"):
+            # SeriesArrays from prometheus_stream, already float64
+            ts_cols.append(np.frombuffer(item.ts, dtype=np.float64))
+            val_cols.append(np.frombuffer(item.values, dtype=np.float64))
+            continue
+        raw = item.get("values", [])
+        ts_cols.append(np.fromiter((float(ts) for ts, _ in raw), dtype=np.float64, count=len(raw)))
+        # numpy parses "NaN"/"+Inf" itself; anything unparsable fails the whole
+        # series, so fall back to a per-sample conversion only then
+        try:
+            val_cols.append(np.asarray([v for _, v in raw], dtype=np.float64))
+        except (TypeError, ValueError):
+            val_cols.append(np.array([_to_float(v) for _, v in raw], dtype=np.float64))
+
+    ts = np.unique(np.concatenate(ts_cols)) if ts_cols else np.empty(0)
+    values = np.full((len(series), len(ts)), np.nan)
+    for i, (ts_col, val_col) in enumerate(zip(ts_cols, val_cols)):
+        values[i, np.searchsorted(ts, ts_col)] = val_col
+    values[~np.isfinite(values)] = np.nan
+    labels = [
+        (item.metric if hasattr(item, "ts") else item.get("metric", {})).get(label, "")
+        for item in series
+    ]
+    return MatrixArrays(labels, ts, values)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def percentiles(values: "np.ndarray", qs=(50, 95, 99)) -> "np.ndarray":
+    """Per series percentiles, shape (series, len(qs)); NaN for empty series."""
+    out = np.full((values.shape[0], len(qs)), np.nan)
+    has_data = ~np.all(np.isnan(values), axis=1)
+    if has_data.any():
+        out[has_data] = np.nanpercentile(values[has_data], qs, axis=1).T
+    return out
+
+
+def rolling_std(values: "np.ndarray", window: int) -> "np.ndarray":
+    """Std of every `window` consecutive steps, shape (series, steps - window + 1).
+
+    Computed from cumulative sums in O(series * steps); windows with fewer
+    than two valid samples are NaN.
+    """
+    n_series, n_steps = values.shape
+    if window > n_steps:
+        return np.full((n_series, 0), np.nan)
+    valid = ~np.isnan(values)
+    # center each series first to keep the sum of squares well conditioned
+    row_mean = np.zeros(n_series)
+    has_data = valid.any(axis=1)
+    if has_data.any():
+        row_mean[has_data] = np.nanmean(values[has_data], axis=1)
+    x = np.where(valid, values - row_mean[:, None], 0.0)
+
+    def window_sum(a):
+        c = np.cumsum(a, axis=1)
+        c = np.concatenate([np.zeros((n_series, 1)), c], axis=1)
+        return c[:, window:] - c[:, :-window]
+
+    count = window_sum(valid.astype(np.float64))
+    total = window_sum(x)
+    total_sq = window_sum(x * x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        var = np.maximum(total_sq / count - mean * mean, 0.0)
+    std = np.sqrt(var)
+    std[count < 2] = np.nan
+    return std
+
+
+def _top_k(flat: "np.ndarray", k: int) -> "np.ndarray":
+    """Indices of the k largest finite values of a flat array, largest first."""
+    candidates = np.flatnonzero(~np.isnan(flat))
+    if len(candidates) > k:
+        part = np.argpartition(flat[candidates], -k)[-k:]
+        candidates = candidates[part]
+    return candidates[np.argsort(flat[candidates])[::-1]]
+
+
+def analyze(
+    arrays: MatrixArrays,
+    top_k: int = DEFAULT_TOP_K,
+    rolling_window: int = DEFAULT_ROLLING_WINDOW,
+    z_threshold: float = DEFAULT_Z_THRESHOLD,
+) -> dict:
+    """Per instance percentiles, rolling jitter, z-score spikes and top-K jumps.
+
+    Jumps are absolute deltas between adjacent steps of one series, a
+    missing sample breaks the pair. z-scores use each series' own mean/std.
+    """
+    _require_numpy()
+    labels, ts, values = arrays
+    n_series, n_steps = values.shape
+
+    pcts = percentiles(values)
+
+    deltas = np.abs(np.diff(values, axis=1))
+    jumps = []
+    if deltas.size:
+        for flat_idx in _top_k(deltas.ravel(), top_k):
+            row, col = divmod(int(flat_idx), n_steps - 1)
+            jumps.append({
+                "instance": labels[row],
+                "delta": float(deltas[row, col]),
+                "ts": float(ts[col + 1]),
+                "prev_ts": float(ts[col]),
+                "prev_v": float(values[row, col]),
+                "v": float(values[row, col + 1]),
+            })
+
+    jitter = rolling_std(values, rolling_window)
+    max_jitter = np.full(n_series, np.nan)
+    max_jitter_ts = np.full(n_series, np.nan)
+    if jitter.size:
+        has_jitter = ~np.all(np.isnan(jitter), axis=1)
+        idx = np.nanargmax(np.where(np.isnan(jitter), -np.inf, jitter), axis=1)
+        max_jitter[has_jitter] = jitter[has_jitter, idx[has_jitter]]
+        # report the window by its last sample
+        max_jitter_ts[has_jitter] = ts[idx[has_jitter] + rolling_window - 1]
+
+    # nanmean/nanstd warn about all-NaN series, those just get NaN
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=1)
+        std = np.nanstd(values, axis=1)
+        z = (values - mean[:, None]) / std[:, None]
+    z[~np.isfinite(z)] = np.nan
+    spike_mask = np.abs(np.nan_to_num(z)) >= z_threshold
+    spike_counts = spike_mask.sum(axis=1)
+    spikes = []
+    abs_z = np.where(spike_mask, np.abs(np.nan_to_num(z)), np.nan)
+    if abs_z.size:
+        for flat_idx in _top_k(abs_z.ravel(), top_k):
+            row, col = divmod(int(flat_idx), n_steps)
+            spikes.append({
+                "instance": labels[row],
+                "z": float(z[row, col]),
+                "ts": float(ts[col]),
+                "v": float(values[row, col]),
+            })
+
+    instances = []
+    for i, label in enumerate(labels):
+        instances.append({
+            "instance": label,
+            "samples": int(np.count_nonzero(~np.isnan(values[i]))),
+            "p50": _nan_to_none(pcts[i, 0]),
+            "p95": _nan_to_none(pcts[i, 1]),
+            "p99": _nan_to_none(pcts[i, 2]),
+            "max_jitter": _nan_to_none(max_jitter[i]),
+            "max_jitter_ts": _nan_to_none(max_jitter_ts[i]),
+            "spikes": int(spike_counts[i]),
+        })
+
+    return {
+        "instances": instances,
+        "top_jumps": jumps,
+        "top_spikes": spikes,
+        "rolling_window": rolling_window,
+        "z_threshold": z_threshold,
+    }
+
+
+def _nan_to_none(value) -> Optional[float]:
+    value = float(value)
+    return None if value != value else value
+
+
+class RollingStats:
+    """Mean/std of the last `window` samples of one series, O(1) per sample.
+
+    Values are shifted by the first sample seen, which keeps the running
+    sum of squares well conditioned over long runs.
+    """
+
+    def __init__(self, window: int = DEFAULT_ROLLING_WINDOW):
+        self.window = window
+        self.samples = deque()
+        self.last: Optional[tuple] = None  # (ts, value)
+        self._shift: Optional[float] = None
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, ts: float, value: float) -> None:
+        if not math.isfinite(value):
+            return
+        if self._shift is None:
+            self._shift = value
+        x = value - self._shift
+        self.samples.append(x)
+        self._sum += x
+        self._sum_sq += x * x
+        if len(self.samples) > self.window:
+            old = self.samples.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+        self.last = (ts, value)
+
+    @property
+    def mean(self) -> float:
+        if not self.samples:
+            return math.nan
+        return self._sum / len(self.samples) + self._shift
+
+    @property
+    def std(self) -> float:
+        n = len(self.samples)
+        if n < 2:
+            return math.nan
+        mean = self._sum / n
+        return math.sqrt(max(self._sum_sq / n - mean * mean, 0.0))
+
+    def zscore(self, value: float) -> float:
+        std = self.std
+        if not std or math.isnan(std):
+            return math.nan
+        return (value - self.mean) / std
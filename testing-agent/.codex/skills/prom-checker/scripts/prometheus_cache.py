@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""On-disk cache of Prometheus range query results.
+
+Results are cached per (prometheus url, promql, step). Each fetched time
+range is stored as one segment file in a compact columnar layout: a JSON
+header with the series labels, followed by float64 timestamp and value
+columns. A query only fetches the parts of its range that no segment
+covers yet. Samples newer than `now - settle_seconds` are never cached,
+since Prometheus may still change them.
+
+Cached queries are aligned to multiples of step, so repeated queries over
+the same window hit the same sample grid.
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from prometheus_common import merge_matrix_results, query_prometheus_range
+
+
+CACHE_DIR_DEFAULT = os.getenv(
+    "PROMETHEUS_CACHE_DIR", str(Path.home() / ".cache" / "prom-checker")
+)
+SETTLE_SECONDS_DEFAULT = 300
+_HEADER_LEN = struct.Struct("<I")
+
+
+def cache_key(prometheus_url: str, promql: str, step_seconds: int) -> str:
+    raw = "\n".join([prometheus_url.rstrip("/"), promql, str(step_seconds)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _float_to_str(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _ts_to_json(ts: float):
+    return int(ts) if ts.is_integer() else ts
+
+
+def write_segment(path: Path, result: dict) -> None:
+    """Write the matrix of a successful result as one columnar segment."""
+    series = result.get("data", {}).get("result", [])
+    header = {"series": []}
+    columns = []
+    for item in series:
+        ts_col = array("d")
+        val_col = array("d")
+        for ts, val in item.get("values", []):
+            try:
+                v = float(val)
+            except (TypeError, ValueError):
+                v = math.nan
+            ts_col.append(float(ts))
+            val_col.append(v)
+        header["series"].append({"metric": item.get("metric", {}), "n": len(ts_col)})
+        columns.extend([ts_col, val_col])
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for col in columns:
+            if sys.byteorder != "little":
+                col.byteswap()
+            col.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_segment(path: Path, start_ts: int, end_ts: int) -> dict:
+    """Read a segment back as a matrix result, keeping samples in [start, end]."""
+    with open(path, "rb") as f:
+        (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len))
+        result = []
+        for meta in header["series"]:
+            n = meta["n"]
+            ts_col = array("d")
+            val_col = array("d")
+            ts_col.fromfile(f, n)
+            val_col.fromfile(f, n)
+            if sys.byteorder != "little":
+                ts_col.byteswap()
+                val_col.byteswap()
+            values = [
+                [_ts_to_json(ts), _float_to_str(v)]
+                for ts, v in zip(ts_col, val_col)
+                if start_ts <= ts <= end_ts
+            ]
+            if values:
+                result.append({"metric": meta["metric"], "values": values})
+    return {"status": "success", "data": {"resultType": "matrix", "result": result}}
+
+
+def missing_ranges(
+    segments: List[Tuple[int, int]], start_ts: int, end_ts: int, step_seconds: int
+) -> List[Tuple[int, int]]:
+    """Return the step aligned sub ranges of [start, end] not covered by segments."""
+    missing = []
+    cursor = start_ts
+    for seg_start, seg_end in sorted(segments):
+        if seg_end < cursor:
+            continue
+        if seg_start > end_ts:
+            break
+        if seg_start > cursor:
+            missing.append((cursor, min(seg_start - step_seconds, end_ts)))
+        cursor = max(cursor, seg_end + step_seconds)
+        if cursor > end_ts:
+            break
+    if cursor <= end_ts:
+        missing.append((cursor, end_ts))
+    return missing
+
+
+class RangeQueryCache:
+    def __init__(self, cache_dir: str = CACHE_DIR_DEFAULT, settle_seconds: int = SETTLE_SECONDS_DEFAULT):
+        self.cache_dir = Path(cache_dir)
+        self.settle_seconds = settle_seconds
+        self.fetched_ranges: List[Tuple[int, int]] = []
+
+    def _index_path(self, key_dir: Path) -> Path:
+        return key_dir / "index.json"
+
+    def _load_index(self, key_dir: Path) -> dict:
+        index_path = self._index_path(key_dir)
+        if not index_path.exists():
+            return {"segments": []}
+        return json.loads(index_path.read_text(encoding="utf-8"))
+
+    def _save_index(self, key_dir: Path, index: dict) -> None:
+        index_path = self._index_path(key_dir)
+        tmp_path = index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index), encoding="utf-8")
+        os.replace(tmp_path, index_path)
+
+    def query_range(
+        self,
+        prometheus_url: str,
+        promql: str,
+        start_ts: float,
+        end_ts: float,
+        step_seconds: int,
+        now: Optional[float] = None,
+        **query_kwargs,
+    ) -> dict:
+        step = int(step_seconds)
+        start = int(math.ceil(start_ts / step) * step)
+        end = int(math.floor(end_ts / step) * step)
+        now = time.time() if now is None else now
+        settled_end = min(end, int(math.floor((now - self.settle_seconds) / step) * step))
+        self.fetched_ranges = []
+
+        key_dir = self.cache_dir / cache_key(prometheus_url, promql, step)
+        key_dir.mkdir(parents=True, exist_ok=True)
+        index = self._load_index(key_dir)
+        index.setdefault("promql", promql)
+        index.setdefault("step", step)
+
+        pieces = []  # [(start, result)], merged in time order
+        if start <= settled_end:
+            segments = [(seg[0], seg[1]) for seg in index["segments"]]
+            for gap_start, gap_end in missing_ranges(segments, start, settled_end, step):
+                result = query_prometheus_range(
+                    prometheus_url, promql, gap_start, gap_end, step, **query_kwargs
+                )
+                self.fetched_ranges.append((gap_start, gap_end))
+                if result.get("status") != "success":
+                    return result
+                seg_file = f"{gap_start}-{gap_end}.bin"
+                write_segment(key_dir / seg_file, result)
+                index["segments"].append([gap_start, gap_end, seg_file])
+            self._save_index(key_dir, index)
+
+            for seg_start, seg_end, seg_file in sorted(index["segments"]):
+                if seg_end < start or seg_start > settled_end:
+                    continue
+                pieces.append((seg_start, read_segment(key_dir / seg_file, start, settled_end)))
+
+        live_start = max(start, settled_end + step)
+        if live_start <= end:
+            result = query_prometheus_range(
+                prometheus_url, promql, live_start, end, step, **query_kwargs
+            )
+            self.fetched_ranges.append((live_start, end))
+            if result.get("status") != "success":
+                return result
+            pieces.append((live_start, result))
+
+        pieces.sort(key=lambda piece: piece[0])
+        return merge_matrix_results([result for _, result in pieces])
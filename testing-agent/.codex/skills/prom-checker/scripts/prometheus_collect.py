@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Collect many metrics for many clusters in one run.
+
+Every (cluster, metric) pair is one PromQL query rendered from a template
+with $be_cluster_id/$fe_cluster_id/$interval. The queries run concurrently
+on an asyncio loop, limited to --concurrency in flight and --rate starting
+per second, and the samples are merged into one columnar result set.
+"""
+import asyncio
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import click
+import requests
+
+from prometheus_common import (
+    PROMETHEUS_URL_DEFAULT,
+    query_prometheus,
+    query_prometheus_range,
+    render_promql,
+)
+from prometheus_cpu_usage import PROMQL_TEMPLATE as CPU_PROMQL_TEMPLATE
+from prometheus_query_latency_jitter import PROMQL_TEMPLATE as LATENCY_PROMQL_TEMPLATE
+
+
+METRIC_TEMPLATES = {
+    "cpu": CPU_PROMQL_TEMPLATE,
+    "latency": LATENCY_PROMQL_TEMPLATE,
+    "compaction_score": (
+        "max(doris_be_tablet_cumulative_max_compaction_score{job=\"$be_cluster_id\"}) "
+        "by (job, instance)"
+    ),
+    "memory": (
+        "sum(doris_be_memory_allocated_bytes{job=\"$be_cluster_id\"}) by (job, instance)"
+    ),
+}
+COLUMNS = ["cluster", "metric", "job", "instance", "ts", "value"]
+
+
+class Cluster(NamedTuple):
+    name: str
+    be_cluster_id: str
+    fe_cluster_id: str
+
+
+class QuerySpec(NamedTuple):
+    cluster: Cluster
+    metric: str
+    promql: str
+
+
+def parse_cluster(spec: str) -> Cluster:
+    """`ID` uses the same job for BE and FE metrics, `BE_ID:FE_ID` sets both."""
+    be_id, _, fe_id = spec.partition(":")
+    return Cluster(spec, be_id, fe_id or be_id)
+
+
+def build_queries(
+    clusters: List[Cluster], templates: Dict[str, str], interval: str
+) -> List[QuerySpec]:
+    return [
+        QuerySpec(
+            cluster,
+            metric,
+            render_promql(
+                template,
+                be_cluster_id=cluster.be_cluster_id,
+                fe_cluster_id=cluster.fe_cluster_id,
+                interval=interval,
+            ),
+        )
+        for cluster in clusters
+        for metric, template in templates.items()
+    ]
+
+
+class AsyncRateLimiter:
+    """Allow at most `rate` acquisitions per second, evenly spaced."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def append_samples(columns: Dict[str, list], spec: QuerySpec, result: dict) -> None:
+    """Append the samples of a vector or matrix result as rows."""
+    data = result.get("data", {})
+    for item in data.get("result", []):
+        metric = item.get("metric", {})
+        samples = item.get("values") if data.get("resultType") == "matrix" else [item.get("value")]
+        for sample in samples or []:
+            if not sample:
+                continue
+            try:
+                value = float(sample[1])
+            except (TypeError, ValueError):
+                value = float("nan")
+            columns["cluster"].append(spec.cluster.name)
+            columns["metric"].append(spec.metric)
+            columns["job"].append(metric.get("job", ""))
+            columns["instance"].append(metric.get("instance", ""))
+            columns["ts"].append(float(sample[0]))
+            columns["value"].append(value)
+
+
+async def collect(
+    prometheus_url: str,
+    queries: List[QuerySpec],
+    concurrency: int = 8,
+    rate: float = 10.0,
+    start_ts: Optional[float] = None,
+    end_ts: Optional[float] = None,
+    step_seconds: int = 60,
+) -> dict:
+    """Run all queries and merge them into {"columns": {...}, "errors": [...]}.
+
+    Instant queries unless start_ts/end_ts are given. The blocking queries
+    run in a thread pool, so they share the keep-alive session.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = AsyncRateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def run_query(spec: QuerySpec) -> dict:
+        if start_ts is None:
+            return query_prometheus(prometheus_url, spec.promql)
+        return query_prometheus_range(
+            prometheus_url, spec.promql, start_ts, end_ts, step_seconds
+        )
+
+    async def run_one(spec: QuerySpec):
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                return spec, await loop.run_in_executor(executor, run_query, spec)
+            except requests.RequestException as exc:
+                return spec, {"status": "error", "error": str(exc)}
+
+    try:
+        results = await asyncio.gather(*(run_one(spec) for spec in queries))
+    finally:
+        executor.shutdown(wait=False)
+
+    columns = {name: [] for name in COLUMNS}
+    errors = []
+    for spec, result in results:
+        if result.get("status") != "success":
+            errors.append({
+                "cluster": spec.cluster.name,
+                "metric": spec.metric,
+                "error": result.get("error", json.dumps(result, ensure_ascii=True)),
+            })
+            continue
+        append_samples(columns, spec, result)
+    return {"columns": columns, "errors": errors}
+
+
+def json_safe(merged: dict) -> dict:
+    """Replace NaN/Inf samples with None, bare NaN tokens are not valid JSON."""
+    columns = {
+        name: [
+            None if isinstance(v, float) and not math.isfinite(v) else v
+            for v in values
+        ]
+        for name, values in merged["columns"].items()
+    }
+    return {**merged, "columns": columns}
+
+
+def parse_metric_option(value: str) -> tuple:
+    name, sep, template = value.partition("=")
+    if not sep or not name or not template:
+        raise click.BadParameter(f"expected NAME=PROMQL_TEMPLATE, got {value!r}")
+    return name, template
+
+
+@click.command(help="Collect several metrics for several clusters concurrently")
+@click.option(
+    "--cluster-id",
+    "cluster_ids",
+    multiple=True,
+    required=True,
+    help="Cluster job ID, repeatable; use BE_ID:FE_ID when BE and FE jobs differ",
+)
+@click.option(
+    "--metric",
+    "metric_names",
+    multiple=True,
+    type=click.Choice(sorted(METRIC_TEMPLATES)),
+    help="Built-in metric, repeatable [default: all built-in metrics]",
+)
+@click.option(
+    "--promql",
+    "custom_metrics",
+    multiple=True,
+    help="Extra metric as NAME=TEMPLATE, supports $be_cluster_id/$fe_cluster_id/$interval",
+)
+@click.option(
+    "--interval",
+    default="1m",
+    show_default=True,
+    help="PromQL range variable, e.g. 1m/5m/10s/1h",
+)
+@click.option(
+    "--window-seconds",
+    type=click.IntRange(1, None),
+    help="Run range queries over the last N seconds instead of instant queries",
+)
+@click.option(
+    "--step-seconds",
+    default=60,
+    show_default=True,
+    type=click.IntRange(1, None),
+    help="Range query step in seconds",
+)
+@click.option(
+    "--concurrency",
+    default=8,
+    show_default=True,
+    type=click.IntRange(1, None),
+    help="Max queries in flight",
+)
+@click.option(
+    "--rate",
+    default=10.0,
+    show_default=True,
+    type=click.FloatRange(0, None),
+    help="Max queries started per second, 0 for unlimited",
+)
+@click.option(
+    "--prometheus-url",
+    default=PROMETHEUS_URL_DEFAULT,
+    show_default=True,
+    help="Prometheus URL",
+)
+@click.option(
+    "--json",
+    "json_output",
+    is_flag=True,
+    help="Print the columnar result as JSON instead of TSV",
+)
+@click.option(
+    "--print-promql",
+    is_flag=True,
+    help="Print the final PromQL of every query",
+)
+def main(
+    cluster_ids: tuple,
+    metric_names: tuple,
+    custom_metrics: tuple,
+    interval: str,
+    window_seconds: Optional[int],
+    step_seconds: int,
+    concurrency: int,
+    rate: float,
+    prometheus_url: str,
+    json_output: bool,
+    print_promql: bool,
+) -> int:
+    templates = {
+        name: METRIC_TEMPLATES[name]
+        for name in (metric_names or sorted(METRIC_TEMPLATES))
+    }
+    try:
+        templates.update(parse_metric_option(value) for value in custom_metrics)
+    except click.BadParameter as exc:
+        click.echo(str(exc), err=True)
+        return 2
+
+    clusters = [parse_cluster(spec) for spec in cluster_ids]
+    queries = build_queries(clusters, templates, interval)
+    if print_promql:
+        for spec in queries:
+            click.echo(f"PROMQL[{spec.cluster.name}/{spec.metric}]: {spec.promql}")
+
+    start_ts = end_ts = None
+    if window_seconds is not None:
+        end_ts = time.time()
+        start_ts = end_ts - window_seconds
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        merged = loop.run_until_complete(
+            collect(
+                prometheus_url,
+                queries,
+                concurrency=concurrency,
+                rate=rate,
+                start_ts=start_ts,
+                end_ts=end_ts,
+                step_seconds=step_seconds,
+            )
+        )
+    finally:
+        loop.close()
+
+    for error in merged["errors"]:
+        click.echo(
+            f"Query failed: {error['cluster']}/{error['metric']}: {error['error']}", err=True
+        )
+
+    columns = merged["columns"]
+    if json_output:
+        click.echo(json.dumps(json_safe(merged), ensure_ascii=True, allow_nan=False))
+    else:
+        click.echo("\t".join(COLUMNS))
+        for row in zip(*(columns[name] for name in COLUMNS)):
+            click.echo("\t".join(str(v) for v in row))
+    return 1 if merged["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(standalone_mode=False))
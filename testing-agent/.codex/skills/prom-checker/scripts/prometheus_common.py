@@ -1,15 +1,99 @@
 #!/usr/bin/env python3
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 PROMETHEUS_URL_DEFAULT = os.getenv("PROMETHEUS_URL", "http://prometheus.example.com")
+# Prometheus rejects range queries returning more than 11000 points per series.
+MAX_POINTS_PER_QUERY = 11000
+DEFAULT_CHUNK_POINTS = 10000
+DEFAULT_MAX_WORKERS = 4
+
+_session: Optional[requests.Session] = None
+
+
+def get_session(pool_size: int = 16) -> requests.Session:
+    """Return the shared keep-alive session used by all queries."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def render_promql(template: str, **variables: str) -> str:
+    """Replace each `$name` in the template with variables[name]."""
+    # longest names first, so $be_cluster_id is not clobbered by a $be variable
+    for name in sorted(variables, key=len, reverse=True):
+        template = template.replace("$" + name, variables[name])
+    return template
 
 
 def query_prometheus(prometheus_url: str, promql: str) -> dict:
     query_url = prometheus_url.rstrip("/") + "/api/v1/query"
-    resp = requests.get(query_url, params={"query": promql}, timeout=10)
+    resp = get_session().get(query_url, params={"query": promql}, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def split_range(
+    start_ts: int, end_ts: int, step_seconds: int, chunk_points: int
+) -> List[Tuple[int, int]]:
+    """Split [start, end] into step aligned chunks of at most chunk_points samples.
+
+    Chunks do not overlap: the next chunk starts one step after the previous end.
+    """
+    chunk_span = (chunk_points - 1) * step_seconds
+    chunks = []
+    chunk_start = start_ts
+    while chunk_start <= end_ts:
+        chunk_end = min(chunk_start + chunk_span, end_ts)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + step_seconds
+    return chunks
+
+
+def merge_matrix_results(results: List[dict]) -> dict:
+    """Merge matrix results of consecutive chunks into one, series are matched by labels."""
+    for result in results:
+        if result.get("status") != "success":
+            return result
+        if result.get("data", {}).get("resultType") != "matrix":
+            return result
+
+    merged = {}
+    for result in results:
+        for item in result["data"].get("result", []):
+            metric = item.get("metric", {})
+            key = tuple(sorted(metric.items()))
+            series = merged.get(key)
+            if series is None:
+                merged[key] = {"metric": metric, "values": list(item.get("values", []))}
+            else:
+                series["values"].extend(item.get("values", []))
+    return {
+        "status": "success",
+        "data": {"resultType": "matrix", "result": list(merged.values())},
+    }
+
+
+def _query_range_once(
+    query_url: str, promql: str, start_ts: int, end_ts: int, step_seconds: int
+) -> dict:
+    params = {
+        "query": promql,
+        "start": start_ts,
+        "end": end_ts,
+        "step": step_seconds,
+    }
+    resp = get_session().get(query_url, params=params, timeout=15)
     resp.raise_for_status()
     return resp.json()
 
@@ -20,14 +104,25 @@ def query_prometheus_range(
     start_ts: float,
     end_ts: float,
     step_seconds: int,
+    chunk_points: int = DEFAULT_CHUNK_POINTS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
 ) -> dict:
+    """Range query; long ranges are split into chunks fetched concurrently and merged."""
     query_url = prometheus_url.rstrip("/") + "/api/v1/query_range"
-    params = {
-        "query": promql,
-        "start": int(start_ts),
-        "end": int(end_ts),
-        "step": int(step_seconds),
-    }
-    resp = requests.get(query_url, params=params, timeout=15)
-    resp.raise_for_status()
-    return resp.json()
+    start_ts, end_ts, step_seconds = int(start_ts), int(end_ts), int(step_seconds)
+    chunk_points = max(2, min(chunk_points, MAX_POINTS_PER_QUERY))
+    chunks = split_range(start_ts, end_ts, step_seconds, chunk_points)
+    if len(chunks) == 1:
+        return _query_range_once(query_url, promql, start_ts, end_ts, step_seconds)
+
+    workers = max(1, min(max_workers, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                lambda chunk: _query_range_once(
+                    query_url, promql, chunk[0], chunk[1], step_seconds
+                ),
+                chunks,
+            )
+        )
+    return merge_matrix_results(results)
@@ -5,7 +5,7 @@ import sys
 import click
 import requests
 
-from prometheus_common import PROMETHEUS_URL_DEFAULT, query_prometheus
+from prometheus_common import PROMETHEUS_URL_DEFAULT, query_prometheus, render_promql
 PROMQL_TEMPLATE = (
     "((sum(rate(doris_be_cpu{job=\"$be_cluster_id\"}[$interval])) by (job, instance)) - "
     "(sum(rate(doris_be_cpu{mode=\"idle\", job=\"$be_cluster_id\"}[$interval])) by (job, instance)) - "
@@ -15,10 +15,7 @@ PROMQL_TEMPLATE = (
 
 
 def build_promql(be_cluster_id: str, interval: str) -> str:
-    return (
-        PROMQL_TEMPLATE.replace("$be_cluster_id", be_cluster_id)
-        .replace("$interval", interval)
-    )
+    return render_promql(PROMQL_TEMPLATE, be_cluster_id=be_cluster_id, interval=interval)
 
 
 def print_vector_result(result: dict) -> int:
@@ -3,11 +3,30 @@ import json
 import math
 import sys
 import time
+from typing import Optional
 
 import click
 import requests
 
-from prometheus_common import PROMETHEUS_URL_DEFAULT, query_prometheus_range
+from prometheus_common import (
+    DEFAULT_CHUNK_POINTS,
+    DEFAULT_MAX_WORKERS,
+    MAX_POINTS_PER_QUERY,
+    PROMETHEUS_URL_DEFAULT,
+    query_prometheus_range,
+    render_promql,
+)
+from prometheus_stream import query_prometheus_range_arrays
+from prometheus_cache import CACHE_DIR_DEFAULT, SETTLE_SECONDS_DEFAULT, RangeQueryCache
+import prometheus_analysis
+from prometheus_analysis import (
+    DEFAULT_ROLLING_WINDOW,
+    DEFAULT_TOP_K,
+    DEFAULT_Z_THRESHOLD,
+    RollingStats,
+    analyze,
+    matrix_to_arrays,
+)
 
 
 PROMQL_TEMPLATE = (
@@ -17,7 +36,7 @@ PROMQL_TEMPLATE = (
 
 
 def build_promql(fe_cluster_id: str) -> str:
-    return PROMQL_TEMPLATE.replace("$fe_cluster_id", fe_cluster_id)
+    return render_promql(PROMQL_TEMPLATE, fe_cluster_id=fe_cluster_id)
 
 
 def ts_to_local(ts: float) -> str:
@@ -38,6 +57,7 @@ def parse_values(raw_values):
 
 
 def find_max_jump(series):
+    """Single largest adjacent delta, used when numpy is not installed."""
     best = None
     for item in series:
         metric = item.get("metric", {})
@@ -60,6 +80,100 @@ def find_max_jump(series):
     return best
 
 
+def check_sample(stats, instance, ts, v, z_threshold, alert_jump_ms, alert_jitter_ms, jitter_alerting):
+    """Yield (kind, value, threshold) alerts for one new sample, then add it."""
+    if stats.last is not None and alert_jump_ms is not None:
+        delta = abs(v - stats.last[1])
+        if delta >= alert_jump_ms:
+            yield "jump", delta, alert_jump_ms
+    # score against the window before the sample joins it
+    z = stats.zscore(v)
+    if len(stats) >= stats.window and abs(z) >= z_threshold:
+        yield "spike_z", z, z_threshold
+    stats.add(ts, v)
+    if alert_jitter_ms is not None and len(stats) >= stats.window:
+        if stats.std >= alert_jitter_ms and instance not in jitter_alerting:
+            jitter_alerting.add(instance)
+            yield "jitter", stats.std, alert_jitter_ms
+        elif stats.std < alert_jitter_ms and instance in jitter_alerting:
+            jitter_alerting.discard(instance)
+            yield "jitter_recovered", stats.std, alert_jitter_ms
+
+
+def follow_mode(
+    prometheus_url: str,
+    promql: str,
+    step_seconds: int,
+    rolling_window: int,
+    z_threshold: float,
+    alert_jump_ms: Optional[float],
+    alert_jitter_ms: Optional[float],
+    poll_seconds: float,
+    follow_seconds: float,
+) -> int:
+    """Poll only the steps after the last seen one and update rolling stats.
+
+    The first poll fetches `rolling_window` steps to warm the windows up,
+    alerts start once an instance has a full window.
+    """
+    stats = {}
+    jitter_alerting = set()
+    alerts = 0
+    now = time.time()
+    deadline = now + follow_seconds if follow_seconds else None
+    last_ts = math.floor(now / step_seconds) * step_seconds - rolling_window * step_seconds
+    click.echo(
+        f"Following every {poll_seconds:g}s, rolling window {rolling_window} x {step_seconds}s"
+    )
+    try:
+        while True:
+            end_ts = math.floor(time.time() / step_seconds) * step_seconds
+            if end_ts > last_ts:
+                try:
+                    result = query_prometheus_range(
+                        prometheus_url, promql, last_ts + step_seconds, end_ts, step_seconds
+                    )
+                except requests.RequestException as exc:
+                    click.echo(f"Prometheus request failed: {exc}", err=True)
+                    result = None
+                if result is not None and result.get("status") != "success":
+                    click.echo(json.dumps(result, ensure_ascii=True), err=True)
+                elif result is not None:
+                    for item in result.get("data", {}).get("result", []):
+                        instance = item.get("metric", {}).get("instance", "")
+                        st = stats.setdefault(instance, RollingStats(rolling_window))
+                        for ts, v in parse_values(item.get("values", [])):
+                            if st.last is not None and ts <= st.last[0]:
+                                continue
+                            for kind, value, threshold in check_sample(
+                                st, instance, ts, v, z_threshold,
+                                alert_jump_ms, alert_jitter_ms, jitter_alerting,
+                            ):
+                                alerts += 1
+                                click.echo(
+                                    "ALERT {} {} instance={} value={:.2f} threshold={:g} latency={:.2f} ms".format(
+                                        ts_to_local(ts), kind, instance, value, threshold, v
+                                    )
+                                )
+                    last_ts = end_ts
+
+                jitters = [(st.std, name) for name, st in stats.items() if not math.isnan(st.std)]
+                if jitters:
+                    worst, worst_instance = max(jitters)
+                    click.echo(
+                        "{} instances={} max_rolling_jitter={:.2f} ms ({})".format(
+                            ts_to_local(end_ts), len(stats), worst, worst_instance
+                        )
+                    )
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    click.echo(f"Stopped following, {alerts} alerts.")
+    return 0
+
+
 @click.command(help="Find the max jitter point for FE query latency")
 @click.option(
     "--fe-cluster-id",
@@ -90,6 +204,90 @@ def find_max_jump(series):
     type=float,
     help="Range end Unix timestamp in seconds",
 )
+@click.option(
+    "--chunk-points",
+    default=DEFAULT_CHUNK_POINTS,
+    show_default=True,
+    type=click.IntRange(2, MAX_POINTS_PER_QUERY),
+    help="Max samples per series in one range request; longer ranges are split",
+)
+@click.option(
+    "--max-workers",
+    default=DEFAULT_MAX_WORKERS,
+    show_default=True,
+    type=click.IntRange(1, None),
+    help="Concurrent range requests when the range is split",
+)
+@click.option(
+    "--top-k",
+    default=DEFAULT_TOP_K,
+    show_default=True,
+    type=click.IntRange(1, None),
+    help="Number of jumps, spikes and instances to report",
+)
+@click.option(
+    "--rolling-window",
+    default=DEFAULT_ROLLING_WINDOW,
+    show_default=True,
+    type=click.IntRange(2, None),
+    help="Samples per rolling jitter (std) window",
+)
+@click.option(
+    "--z-threshold",
+    default=DEFAULT_Z_THRESHOLD,
+    show_default=True,
+    type=float,
+    help="Samples with |z-score| at or above this are spikes",
+)
+@click.option(
+    "--json",
+    "json_output",
+    is_flag=True,
+    help="Print the full analysis as JSON",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    help="Keep polling the newest steps and alert on thresholds instead of a one-shot query; not with --start/--end/--window-seconds/--json",
+)
+@click.option(
+    "--poll-seconds",
+    type=click.FloatRange(1, None),
+    help="Follow mode poll interval [default: --step-seconds]",
+)
+@click.option(
+    "--follow-seconds",
+    default=0,
+    show_default=True,
+    type=click.FloatRange(0, None),
+    help="Stop following after N seconds, 0 to run until Ctrl-C",
+)
+@click.option(
+    "--alert-jump-ms",
+    type=click.FloatRange(0, None),
+    help="Follow mode: alert when adjacent samples differ by at least this",
+)
+@click.option(
+    "--alert-jitter-ms",
+    type=click.FloatRange(0, None),
+    help="Follow mode: alert when the rolling std rises above this (and when it recovers)",
+)
+@click.option(
+    "--cache-dir",
+    default=CACHE_DIR_DEFAULT,
+    show_default=True,
+    help="Local cache of range results; settled samples are reused across runs",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always fetch the whole range from Prometheus",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Stream the gzip response into float64 arrays; much less memory for large matrices, bypasses the cache",
+)
 @click.option(
     "--prometheus-url",
     default=PROMETHEUS_URL_DEFAULT,
@@ -112,6 +310,20 @@ def main(
     step_seconds: int,
     start: float,
     end: float,
+    chunk_points: int,
+    max_workers: int,
+    top_k: int,
+    rolling_window: int,
+    z_threshold: float,
+    json_output: bool,
+    follow: bool,
+    poll_seconds: Optional[float],
+    follow_seconds: float,
+    alert_jump_ms: Optional[float],
+    alert_jitter_ms: Optional[float],
+    cache_dir: str,
+    no_cache: bool,
+    stream: bool,
     prometheus_url: str,
     print_promql: bool,
     debug: bool,
@@ -120,6 +332,30 @@ def main(
     if print_promql:
         click.echo(f"PROMQL: {promql}")
 
+    if follow:
+        ctx = click.get_current_context()
+        one_shot = [
+            f"--{name.replace('_', '-')}"
+            for name in ("start", "end", "window_seconds")
+            if ctx.get_parameter_source(name) != click.core.ParameterSource.DEFAULT
+        ]
+        if json_output:
+            one_shot.append("--json")
+        if one_shot:
+            click.echo(f"--follow can not be used with {', '.join(one_shot)}", err=True)
+            return 2
+        return follow_mode(
+            prometheus_url,
+            promql,
+            step_seconds,
+            rolling_window,
+            z_threshold,
+            alert_jump_ms,
+            alert_jitter_ms,
+            poll_seconds or step_seconds,
+            follow_seconds,
+        )
+
     end_ts = end if end is not None else time.time()
     start_ts = start if start is not None else end_ts - window_seconds
 
@@ -127,9 +363,21 @@ def main(
         click.echo("Invalid time range: start must be before end.", err=True)
         return 2
 
+    query_range = query_prometheus_range
+    if stream:
+        query_range = query_prometheus_range_arrays
+    elif not no_cache:
+        query_range = RangeQueryCache(cache_dir, SETTLE_SECONDS_DEFAULT).query_range
+
     try:
-        result = query_prometheus_range(
-            prometheus_url, promql, start_ts, end_ts, step_seconds
+        result = query_range(
+            prometheus_url,
+            promql,
+            start_ts,
+            end_ts,
+            step_seconds,
+            chunk_points=chunk_points,
+            max_workers=max_workers,
         )
     except requests.RequestException as exc:
         click.echo(f"Prometheus request failed: {exc}", err=True)
@@ -139,7 +387,10 @@ def main(
         click.echo(json.dumps(result, indent=2, ensure_ascii=True))
         return 1
 
-    if debug:
+    if debug and stream:
+        for item in result.get("data", {}).get("result", []):
+            click.echo(f"{json.dumps(item.metric, ensure_ascii=True)} samples={len(item.ts)}", err=True)
+    elif debug:
         click.echo(json.dumps(result, indent=2, ensure_ascii=True), err=True)
 
     data = result.get("data", {})
@@ -148,13 +399,34 @@ def main(
         return 1
 
     series = data.get("result", [])
-    click.echo(f"Window: {ts_to_local(start_ts)} -> {ts_to_local(end_ts)}")
-    click.echo(f"Series count: {len(series)}")
-    if not series:
-        click.echo("No series returned.")
+    if not json_output:
+        click.echo(f"Window: {ts_to_local(start_ts)} -> {ts_to_local(end_ts)}")
+        click.echo(f"Series count: {len(series)}")
+        if not series:
+            click.echo("No series returned.")
+            return 0
+
+    report = None
+    if prometheus_analysis.np is not None:
+        report = analyze(
+            matrix_to_arrays(series),
+            top_k=top_k,
+            rolling_window=rolling_window,
+            z_threshold=z_threshold,
+        )
+        best = report["top_jumps"][0] if report["top_jumps"] else None
+    else:
+        if stream:
+            series = [
+                {"metric": item.metric, "values": list(zip(item.ts, item.values))}
+                for item in series
+            ]
+        best = find_max_jump(series)
+
+    if json_output:
+        click.echo(json.dumps(report or {"top_jumps": [best] if best else []}, indent=2))
         return 0
 
-    best = find_max_jump(series)
     if not best:
         click.echo("No valid samples.")
         return 0
@@ -174,6 +446,48 @@ def main(
             best["v"], ts_to_local(best["ts"])
         )
     )
+    if report is None:
+        click.echo("numpy not installed, only the max jump is reported.", err=True)
+        return 0
+
+    click.echo(f"Top {top_k} jumps:")
+    for jump in report["top_jumps"]:
+        click.echo(
+            "  {:.2f} ms at {} (instance {}, {:.2f} -> {:.2f})".format(
+                jump["delta"], ts_to_local(jump["ts"]), jump["instance"],
+                jump["prev_v"], jump["v"],
+            )
+        )
+
+    click.echo(
+        f"Top {top_k} instances by p99 (rolling jitter over {rolling_window} samples):"
+    )
+    click.echo("  instance  p50  p95  p99  max_jitter  max_jitter_at  spikes")
+    ranked = sorted(
+        (item for item in report["instances"] if item["p99"] is not None),
+        key=lambda item: item["p99"],
+        reverse=True,
+    )
+    for item in ranked[:top_k]:
+        jitter_at = item["max_jitter_ts"]
+        click.echo(
+            "  {}  {:.2f}  {:.2f}  {:.2f}  {}  {}  {}".format(
+                item["instance"], item["p50"], item["p95"], item["p99"],
+                "-" if item["max_jitter"] is None else "{:.2f}".format(item["max_jitter"]),
+                "-" if jitter_at is None else ts_to_local(jitter_at),
+                item["spikes"],
+            )
+        )
+
+    click.echo(f"Top {top_k} spikes (|z| >= {z_threshold}):")
+    if not report["top_spikes"]:
+        click.echo("  none")
+    for spike in report["top_spikes"]:
+        click.echo(
+            "  z={:.2f} {:.2f} ms at {} (instance {})".format(
+                spike["z"], spike["v"], ts_to_local(spike["ts"]), spike["instance"]
+            )
+        )
     return 0
 
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Streaming range queries that parse samples straight into float64 arrays.
+
+`resp.json()` turns every sample of a matrix into a Python list of two
+strings. Here the gzip response is read in chunks and scanned
+incrementally: only the small metric objects go through the json module,
+the samples of each series are converted in one pass into two float64
+`array('d')` columns, which numpy can wrap without a copy
+(`np.frombuffer(series.ts)`). Peak memory is one series, not the matrix.
+"""
+import codecs
+import json
+import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, NamedTuple
+
+from prometheus_common import (
+    DEFAULT_CHUNK_POINTS,
+    DEFAULT_MAX_WORKERS,
+    MAX_POINTS_PER_QUERY,
+    get_session,
+    split_range,
+)
+
+
+_MATRIX_START_RE = re.compile(r'"resultType"\s*:\s*"matrix"\s*,\s*"result"\s*:\s*\[')
+# the `]]` closing the last [ts,"value"] pair and the values list
+_VALUES_END_RE = re.compile(r"\]\s*\]")
+# [1700000000,"0.5"],[1700000060,"NaN"] -> 1700000000,0.5,1700000060,NaN
+_STRIP_SAMPLE = str.maketrans("", "", '[]" \t\r\n')
+_WS_RE = re.compile(r"\s*")
+
+
+class SeriesArrays(NamedTuple):
+    metric: dict
+    ts: array  # float64 unix seconds
+    values: array  # float64, NaN/Inf kept as is
+
+
+class _MatrixReader:
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer, False at the end of the body."""
+        if self.eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def skip_ws(self) -> None:
+        while True:
+            self.pos = _WS_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def expect(self, char: str) -> None:
+        self.skip_ws()
+        if self.buf[self.pos:self.pos + 1] != char:
+            raise ValueError(f"expected {char!r} at {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def peek(self) -> str:
+        self.skip_ws()
+        return self.buf[self.pos:self.pos + 1]
+
+    def decode_value(self):
+        decoder = json.JSONDecoder()
+        self.skip_ws()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def read_samples(self) -> SeriesArrays:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return SeriesArrays({}, array("d"), array("d"))
+        # the values of one series hold at most MAX_POINTS_PER_QUERY samples,
+        # so buffer them whole and convert them with C level str/array calls
+        while True:
+            m = _VALUES_END_RE.search(self.buf, self.pos)
+            if m is not None:
+                break
+            if not self.fill():
+                raise ValueError("unterminated values list")
+        parts = self.buf[self.pos:m.start() + 1].translate(_STRIP_SAMPLE).split(",")
+        self.pos = m.end()
+        if len(parts) % 2:
+            raise ValueError(f"bad samples near {self.buf[self.pos - 40:self.pos]!r}")
+        flat = array("d", map(float, parts))
+        return SeriesArrays({}, flat[0::2], flat[1::2])
+
+    def read_series(self) -> SeriesArrays:
+        metric = {}
+        samples = SeriesArrays({}, array("d"), array("d"))
+        self.expect("{")
+        while self.peek() != "}":
+            key = self.decode_value()
+            self.expect(":")
+            if key == "values":
+                samples = self.read_samples()
+            elif key == "metric":
+                metric = self.decode_value()
+            else:
+                self.decode_value()
+            if self.peek() == ",":
+                self.pos += 1
+        self.pos += 1
+        return SeriesArrays(metric, samples.ts, samples.values)
+
+    def read(self) -> dict:
+        while True:
+            m = _MATRIX_START_RE.search(self.buf)
+            if m is not None:
+                break
+            if not self.fill():
+                # not a matrix: an error response, small enough to decode whole
+                return json.loads(self.buf)
+        self.pos = m.end()
+        series = []
+        while self.peek() != "]":
+            series.append(self.read_series())
+            if self.peek() == ",":
+                self.pos += 1
+        return {"status": "success", "data": {"resultType": "matrix", "result": series}}
+
+
+def parse_matrix_stream(chunks: Iterator[bytes]) -> dict:
+    """Parse a query_range response body given as byte chunks.
+
+    Matrix results come back with `data.result` as a list of SeriesArrays,
+    any other response is returned as decoded JSON.
+    """
+    return _MatrixReader(iter(chunks)).read()
+
+
+def _query_range_stream_once(
+    query_url: str, promql: str, start_ts: int, end_ts: int, step_seconds: int
+) -> dict:
+    params = {
+        "query": promql,
+        "start": start_ts,
+        "end": end_ts,
+        "step": step_seconds,
+    }
+    resp = get_session().get(
+        query_url,
+        params=params,
+        headers={"Accept-Encoding": "gzip"},
+        timeout=15,
+        stream=True,
+    )
+    with resp:
+        resp.raise_for_status()
+        return parse_matrix_stream(resp.iter_content(chunk_size=1 << 16))
+
+
+def merge_series_arrays(results: List[dict]) -> dict:
+    """Merge streamed results of consecutive chunks, series are matched by labels."""
+    for result in results:
+        if result.get("status") != "success":
+            return result
+        if result.get("data", {}).get("resultType") != "matrix":
+            return result
+
+    merged = {}
+    for result in results:
+        for series in result["data"]["result"]:
+            key = tuple(sorted(series.metric.items()))
+            if key not in merged:
+                merged[key] = series
+            else:
+                merged[key].ts.extend(series.ts)
+                merged[key].values.extend(series.values)
+    return {
+        "status": "success",
+        "data": {"resultType": "matrix", "result": list(merged.values())},
+    }
+
+
+def query_prometheus_range_arrays(
+    prometheus_url: str,
+    promql: str,
+    start_ts: float,
+    end_ts: float,
+    step_seconds: int,
+    chunk_points: int = DEFAULT_CHUNK_POINTS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> dict:
+    """Like query_prometheus_range, but series come back as SeriesArrays."""
+    query_url = prometheus_url.rstrip("/") + "/api/v1/query_range"
+    start_ts, end_ts, step_seconds = int(start_ts), int(end_ts), int(step_seconds)
+    chunk_points = max(2, min(chunk_points, MAX_POINTS_PER_QUERY))
+    chunks = split_range(start_ts, end_ts, step_seconds, chunk_points)
+    workers = max(1, min(max_workers, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                lambda chunk: _query_range_stream_once(
+                    query_url, promql, chunk[0], chunk[1], step_seconds
+                ),
+                chunks,
+            )
+        )
+    return merge_series_arrays(results)